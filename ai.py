@@ -1,5 +1,6 @@
 from flask import Blueprint, request, jsonify
-from database import get_db_connection
+from database import get_db_connection, parse_id
+from plan_store import fetch_curriculum
 import json
 
 ai_bp = Blueprint('ai', __name__)
@@ -7,12 +8,14 @@ ai_bp = Blueprint('ai', __name__)
 @ai_bp.route('/chat', methods=['POST'])
 def chat():
     data = request.json
-    user_id = data.get('user_id')
+    user_id = parse_id(data.get('user_id'))
     message = data.get('message', '').lower()
+    if user_id is None:
+        return jsonify({'error': 'A valid user_id is required'}), 400
     
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
-    curriculum = conn.execute('SELECT * FROM curriculum WHERE user_id = ?', (user_id,)).fetchall()
+    curriculum = fetch_curriculum(conn, user_id)
     conn.close()
     
     if not user_data:
@@ -1,8 +1,15 @@
 import os
 import json
+import math
 import random
+import threading
+import time
+import itertools
+import heapq
+from concurrent.futures import Future, ThreadPoolExecutor
 import google.generativeai as genai
 from dotenv import load_dotenv
+import plan_cache
 
 load_dotenv()
 
@@ -10,55 +17,207 @@ load_dotenv()
 # Note: In a production environment, the API key should be set in a .env file
 API_KEY = os.getenv("GEMINI_API_KEY")
 
+# Admission control for model calls: sustained calls per second, burst size,
+# how many calls may wait, and how many run concurrently.
+GEMINI_RATE_PER_SEC = float(os.getenv("GEMINI_RATE_PER_SEC", "1.0"))
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "5"))
+GEMINI_QUEUE_SIZE = int(os.getenv("GEMINI_QUEUE_SIZE", "20"))
+GEMINI_WORKERS = int(os.getenv("GEMINI_WORKERS", "4"))
+
+# Request priorities; lower is served first
+INTERACTIVE = 0
+BATCH = 1
+
+class AdmissionRejected(Exception):
+    """Raised when the model call queue is full. retry_after is in seconds."""
+    def __init__(self, retry_after):
+        super().__init__(f"AI request queue is full, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+class TokenBucket:
+    """Allows `rate` acquisitions per second with bursts of up to `capacity`"""
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+class AdmissionQueue:
+    """Bounded priority queue of model calls drained by worker threads under a token bucket.
+
+    A single dispatcher waits for a free worker and a token before taking
+    the most urgent job, so nothing holds a rate-limit slot while waiting
+    and an interactive call submitted later still overtakes queued batch
+    work. Batch work may only fill half of the queue so interactive
+    requests always find room.
+    """
+    def __init__(self, bucket, max_pending, workers):
+        self.bucket = bucket
+        self.max_pending = max_pending
+        self.workers = workers
+        self.jobs = []
+        self.sequence = itertools.count()
+        self.pending = 0
+        self.lock = threading.Lock()
+        self.job_ready = threading.Condition(self.lock)
+        self.free_workers = threading.Semaphore(workers)
+        self.executor = None
+
+    def _start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='ai-admission')
+        threading.Thread(target=self._dispatch, name='ai-admission-dispatcher', daemon=True).start()
+
+    def submit(self, fn, priority=INTERACTIVE):
+        limit = self.max_pending if priority == INTERACTIVE else self.max_pending // 2
+        future = Future()
+        with self.lock:
+            if self.executor is None:
+                self._start()
+            if self.pending >= limit:
+                raise AdmissionRejected(max(1, math.ceil(self.pending / self.bucket.rate)))
+            self.pending += 1
+            heapq.heappush(self.jobs, (priority, next(self.sequence), fn, future))
+            self.job_ready.notify()
+        return future
+
+    def _dispatch(self):
+        while True:
+            self.free_workers.acquire()
+            with self.lock:
+                while not self.jobs:
+                    self.job_ready.wait()
+            self.bucket.acquire()
+            # Pick only now, so anything queued while we waited is considered
+            with self.lock:
+                _, _, fn, future = heapq.heappop(self.jobs)
+            self.executor.submit(self._run, fn, future)
+
+    def _run(self, fn, future):
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn())
+                except Exception as e:
+                    future.set_exception(e)
+        finally:
+            with self.lock:
+                self.pending -= 1
+            self.free_workers.release()
+
+_admission = AdmissionQueue(TokenBucket(GEMINI_RATE_PER_SEC, GEMINI_BURST), GEMINI_QUEUE_SIZE, GEMINI_WORKERS)
+
 class GenerativeAIService:
     @staticmethod
-    def generate_curriculum(career_goal, weak_subjects, weeks=8, hours_per_day=2.0):
+    def generate_curriculum(career_goal, weak_subjects, weeks=8, hours_per_day=2.0, priority=INTERACTIVE):
         """
         Generates a structured curriculum JSON using Google's Gemini AI.
+        Model calls pass through admission control; raises AdmissionRejected when overloaded.
+        A cached plan for the same goal, weeks and hours is tailored to the weak subjects instead.
         """
         if not API_KEY:
             print("WARNING: GEMINI_API_KEY not found. Using Mock AI generator.")
             return GenerativeAIService._mock_ai_generate(career_goal, weak_subjects, weeks, hours_per_day)
 
+        cached = plan_cache.lookup(career_goal, weeks, hours_per_day)
+        if cached is not None:
+            return GenerativeAIService._tailor_to_weak_subjects(cached, weak_subjects)
+
+        future = _admission.submit(
+            lambda: GenerativeAIService._call_model(career_goal, weak_subjects, weeks, hours_per_day), priority)
         try:
-            genai.configure(api_key=API_KEY)
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            
-            prompt = f"""
-            You are an expert educational consultant. Generate a highly personalized learning curriculum for a student pursuing a career as a '{career_goal}'.
-            
-            Student Constraints:
-            - Weak Subjects: {weak_subjects}
-            - Duration: {weeks} weeks
-            - Available time: {hours_per_day} hours per day
-            
-            Return ONLY a JSON array of objects. Each object represents a topic and must have exactly these keys:
-            - topic: (string) name of the topic
-            - difficulty_level: (string: "Easy", "Medium", or "Hard")
-            - estimated_hours: (integer) hours to master
-            - week_number: (integer) which week to study this
-            - subtopics: (array of strings) 3-4 specific concepts within this topic
-            
-            The JSON should be valid and follow the student constraints. PRIORITIZE weak subjects in the first few weeks.
-            Ensure the total hours fit within the available {weeks * 7 * hours_per_day} total hours.
-            """
-            
-            response = model.generate_content(prompt)
-            # Find the JSON block in the response
-            text = response.text
-            start = text.find('[')
-            end = text.rfind(']') + 1
-            
-            if start != -1 and end != -1:
-                curriculum_json = text[start:end]
-                return json.loads(curriculum_json)
-            else:
-                raise Exception("Could not find valid JSON in AI response")
-                
+            curriculum = future.result()
         except Exception as e:
             print(f"AI Generation Error: {e}")
             return GenerativeAIService._mock_ai_generate(career_goal, weak_subjects, weeks, hours_per_day)
 
+        # Only plans without weak subjects are generic enough to share
+        if not weak_subjects:
+            try:
+                plan_cache.store(career_goal, weeks, hours_per_day, curriculum)
+            except Exception as e:
+                print(f"Generation cache error: {e}")
+        return curriculum
+
+    @staticmethod
+    def refresh_cached_plan(career_goal, weeks=8, hours_per_day=2.0, priority=BATCH):
+        """
+        Generates the base plan for a combination and caches it. Raises on any failure,
+        including AdmissionRejected, rather than falling back to the mock generator.
+        """
+        future = _admission.submit(
+            lambda: GenerativeAIService._call_model(career_goal, '', weeks, hours_per_day), priority)
+        curriculum = future.result()
+        plan_cache.store(career_goal, weeks, hours_per_day, curriculum)
+        return curriculum
+
+    @staticmethod
+    def _tailor_to_weak_subjects(curriculum, weak_subjects):
+        """
+        Copy of a cached plan with the first weeks focused on the weak subjects,
+        the same way the mock generator does it.
+        """
+        tailored = [dict(item) for item in curriculum]
+        if weak_subjects:
+            weaks = [w.strip() for w in weak_subjects.split(',') if w.strip()]
+            for i, w in enumerate(weaks[:2]):
+                if i < len(tailored):
+                    item = tailored[i]
+                    item['topic'] = f"{item.get('topic', 'Topic')} (Focus: {w})"
+                    item['subtopics'] = [f"Fundamental {w} concepts"] + list(item.get('subtopics', []))[:3]
+        return tailored
+
+    @staticmethod
+    def _call_model(career_goal, weak_subjects, weeks, hours_per_day):
+        """
+        One Gemini request, parsed into the curriculum list. Raises on any failure.
+        """
+        genai.configure(api_key=API_KEY)
+        model = genai.GenerativeModel('gemini-1.5-flash')
+        
+        prompt = f"""
+        You are an expert educational consultant. Generate a highly personalized learning curriculum for a student pursuing a career as a '{career_goal}'.
+        
+        Student Constraints:
+        - Weak Subjects: {weak_subjects}
+        - Duration: {weeks} weeks
+        - Available time: {hours_per_day} hours per day
+        
+        Return ONLY a JSON array of objects. Each object represents a topic and must have exactly these keys:
+        - topic: (string) name of the topic
+        - difficulty_level: (string: "Easy", "Medium", or "Hard")
+        - estimated_hours: (integer) hours to master
+        - week_number: (integer) which week to study this
+        - subtopics: (array of strings) 3-4 specific concepts within this topic
+        
+        The JSON should be valid and follow the student constraints. PRIORITIZE weak subjects in the first few weeks.
+        Ensure the total hours fit within the available {weeks * 7 * hours_per_day} total hours.
+        """
+        
+        response = model.generate_content(prompt)
+        # Find the JSON block in the response
+        text = response.text
+        start = text.find('[')
+        end = text.rfind(']') + 1
+        
+        if start != -1 and end != -1:
+            curriculum_json = text[start:end]
+            return json.loads(curriculum_json)
+        else:
+            raise Exception("Could not find valid JSON in AI response")
+
     @staticmethod
     def _mock_ai_generate(career_goal, weak_subjects, weeks=8, hours_per_day=2.0):
         """
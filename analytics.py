@@ -1,32 +1,57 @@
 from flask import Blueprint, jsonify, request
-from database import get_db_connection
+from database import get_db_connection, iter_shard_connections, parse_id
+from progress_log import completion_trend_all_shards, BUCKET_SECONDS
+from skill_stats import top_terms
 
 analytics_bp = Blueprint('analytics', __name__)
 
+def int_arg(name):
+    """Integer query parameter: None when absent, raises ValueError when malformed"""
+    value = request.args.get(name)
+    if value is None or value == '':
+        return None
+    return int(value)
+
 @analytics_bp.route('/stats', methods=['GET'])
 def get_stats():
     conn = get_db_connection()
     
     total_users = conn.execute('SELECT COUNT(*) FROM users').fetchone()[0]
-    total_curriculum_items = conn.execute('SELECT COUNT(*) FROM curriculum').fetchone()[0]
-    completed_items = conn.execute("SELECT COUNT(*) FROM curriculum WHERE status = 'completed'").fetchone()[0]
+    
+    # Served from the incrementally maintained profile_terms counters
+    top_skills = top_terms(conn, 'skill')
+    top_weak_subjects = top_terms(conn, 'weak_subject')
+    top_career_goals = top_terms(conn, 'career_goal')
     
     conn.close()
     
+    # Curriculum rows may be spread over several shards
+    total_curriculum_items = 0
+    completed_items = 0
+    for shard_conn in iter_shard_connections():
+        total, completed = shard_conn.execute(
+            "SELECT COUNT(*), COUNT(CASE WHEN status = 'completed' THEN 1 END) FROM curriculum").fetchone()
+        total_curriculum_items += total
+        completed_items += completed
+    
     return jsonify({
         "total_users": total_users,
         "total_curriculum_items": total_curriculum_items,
         "completed_items": completed_items,
-        "top_skills": ["Python", "React", "Data Science", "Machine Learning"] # Mock data for demo
+        "top_skills": top_skills,
+        "top_weak_subjects": top_weak_subjects,
+        "top_career_goals": top_career_goals
     }), 200
 
 @analytics_bp.route('/user-stats', methods=['POST'])
 def get_user_stats():
     """Get analytics for a specific user"""
     data = request.json
-    user_id = data.get('user_id')
+    user_id = parse_id(data.get('user_id'))
+    if user_id is None:
+        return jsonify({"error": "A valid user_id is required"}), 400
     
-    conn = get_db_connection()
+    conn = get_db_connection(user_id)
     
     # Get user's curriculum data
     curriculum = conn.execute('SELECT * FROM curriculum WHERE user_id = ?', (user_id,)).fetchall()
@@ -56,3 +81,26 @@ def get_user_stats():
         "difficulty_breakdown": difficulty_breakdown
     }), 200
 
+@analytics_bp.route('/completion-trend', methods=['GET'])
+def get_completion_trend():
+    """Completions per hour/day from the progress rollups, optionally per user, branch or difficulty"""
+    bucket = request.args.get('bucket', 'day')
+    if bucket not in BUCKET_SECONDS:
+        return jsonify({"error": "bucket must be 'hour' or 'day'"}), 400
+
+    try:
+        user_id = int_arg('user_id')
+        since = int_arg('since')
+        until = int_arg('until')
+    except ValueError:
+        return jsonify({"error": "user_id, since and until must be integers"}), 400
+
+    points = completion_trend_all_shards(bucket=bucket, user_id=user_id,
+                                         branch=request.args.get('branch'),
+                                         difficulty=request.args.get('difficulty'),
+                                         since=since, until=until)
+
+    return jsonify({
+        "bucket": bucket,
+        "points": points
+    }), 200
@@ -1,3 +1,4 @@
+import os
 from flask import Flask
 from flask_cors import CORS
 from database import init_db
@@ -5,6 +6,9 @@ from routes.auth import auth_bp
 from routes.curriculum import curriculum_bp
 from routes.analytics import analytics_bp
 from routes.ai import ai_bp
+from progress_log import start_rollup_worker
+from snapshots import start_compaction_worker
+from warmup import CACHE_WARMUP_COMBINATIONS, start_warmup
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
@@ -12,6 +16,30 @@ CORS(app)  # Enable CORS for all routes
 # Initialize Database
 init_db()
 
+ROLLUP_INTERVAL_SECONDS = int(os.getenv("ROLLUP_INTERVAL_SECONDS", "0"))
+COMPACTION_INTERVAL_SECONDS = int(os.getenv("COMPACTION_INTERVAL_SECONDS", "0"))
+
+def start_background_workers():
+    """Start the optional background jobs; call once per serving process"""
+    # Keep progress trend rollups fresh in the background (disabled when unset)
+    if ROLLUP_INTERVAL_SECONDS > 0:
+        start_rollup_worker(ROLLUP_INTERVAL_SECONDS)
+
+    # Periodically enforce snapshot retention and release free pages (disabled when unset)
+    if COMPACTION_INTERVAL_SECONDS > 0:
+        start_compaction_worker(COMPACTION_INTERVAL_SECONDS)
+
+    # Pre-generate plans for the most common goals so new sign-ups hit the cache (disabled when unset)
+    if CACHE_WARMUP_COMBINATIONS > 0:
+        start_warmup(CACHE_WARMUP_COMBINATIONS)
+
+# `python app.py` runs the debug reloader: this module is imported once by the
+# file watcher and again by the child process it spawns (WERKZEUG_RUN_MAIN set),
+# and only the child serves requests. Starting the jobs in the watcher too
+# would run every one of them twice.
+if __name__ != '__main__' or os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+    start_background_workers()
+
 # Register Blueprints
 app.register_blueprint(auth_bp, url_prefix='/api/auth')
 app.register_blueprint(curriculum_bp, url_prefix='/api/curriculum')
@@ -1,6 +1,9 @@
 import os
 from flask import Blueprint, request, jsonify, send_from_directory
-from database import get_db_connection
+from database import get_db_connection, parse_id
+from skill_stats import apply_profile_change
+from plan_store import sync_profile_columns
+from write_queue import run_write
 from werkzeug.utils import secure_filename
 import json
 
@@ -70,22 +73,23 @@ def register():
     
     # Check for existing user
     existing_user = c.execute("SELECT id FROM users WHERE email = ?", (email,)).fetchone()
+    conn.close()
     if existing_user:
-        conn.close()
         return jsonify({"error": "Registration failed", "details": {"email": "Email already registered"}}), 400
 
+    def write(conn):
+        conn.execute("""INSERT INTO users (name, email, password, career_goal, weak_subjects, weeks_available, hours_per_day, branch) 
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (name, email, password, career_goal, weak_subjects, weeks_available, hours_per_day, branch))
+        apply_profile_change(conn, None, {'career_goal': career_goal, 'weak_subjects': weak_subjects})
+
     try:
-        c.execute("""INSERT INTO users (name, email, password, career_goal, weak_subjects, weeks_available, hours_per_day, branch) 
-                     VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
-                  (name, email, password, career_goal, weak_subjects, weeks_available, hours_per_day, branch))
-        conn.commit()
+        run_write(write)
         print(f"User registered successfully: {email}")  # Debug logging
     except Exception as e:
-        conn.close()
         print(f"Database error: {e}")
         return jsonify({"error": "Database error", "details": {"general": "An unexpected error occurred"}}), 500
     
-    conn.close()
     return jsonify({"message": "User registered successfully"}), 201
 
 @auth_bp.route('/login', methods=['POST'])
@@ -124,26 +128,31 @@ def login():
 def update_profile():
     """Update user profile information"""
     data = request.json
-    user_id = data.get('user_id')
+    user_id = parse_id(data.get('user_id'))
+    if user_id is None:
+        return jsonify({"error": "A valid user_id is required"}), 400
     career_goal = data.get('career_goal')
     skills = data.get('skills')
     weak_subjects = data.get('weak_subjects')
     branch = data.get('branch')
     learning_preferences = json.dumps(data.get('learning_preferences', []))
     
-    conn = get_db_connection()
-    c = conn.cursor()
+    def write(conn):
+        old_profile = conn.execute('SELECT career_goal, skills, weak_subjects FROM users WHERE id = ?', (user_id,)).fetchone()
+        conn.execute('''UPDATE users 
+                        SET career_goal = ?, skills = ?, weak_subjects = ?, branch = ?, learning_preferences = ? 
+                        WHERE id = ?''',
+                     (career_goal, skills, weak_subjects, branch, learning_preferences, user_id))
+        if old_profile:
+            apply_profile_change(conn, dict(old_profile),
+                                 {'career_goal': career_goal, 'skills': skills, 'weak_subjects': weak_subjects})
     
     try:
-        c.execute('''UPDATE users 
-                     SET career_goal = ?, skills = ?, weak_subjects = ?, branch = ?, learning_preferences = ? 
-                     WHERE id = ?''',
-                  (career_goal, skills, weak_subjects, branch, learning_preferences, user_id))
-        conn.commit()
-        conn.close()
+        run_write(write)
+        # Keep the cohort copies on the user's curriculum rows in step
+        run_write(lambda conn: sync_profile_columns(conn, user_id), user_id=user_id)
         return jsonify({"message": "Profile updated successfully"}), 200
     except Exception as e:
-        conn.close()
         print(f"Database error: {e}")
         return jsonify({"error": "Failed to update profile"}), 500
 
@@ -163,11 +172,7 @@ def upload_profile_pic():
         file.save(file_path)
         
         # Update database
-        conn = get_db_connection()
-        c = conn.cursor()
-        c.execute("UPDATE users SET profile_pic = ? WHERE id = ?", (file_path, user_id))
-        conn.commit()
-        conn.close()
+        run_write(lambda conn: conn.execute("UPDATE users SET profile_pic = ? WHERE id = ?", (file_path, user_id)))
         
         return jsonify({"message": "Profile picture uploaded", "path": file_path}), 200
     
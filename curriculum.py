@@ -1,15 +1,18 @@
 from flask import Blueprint, request, jsonify, send_file
-from database import get_db_connection
+from database import NO_SHARD, get_db_connection, parse_id, shard_key
 import io
 from fpdf import FPDF
 import random
-from ai_service import GenerativeAIService
+from ai_service import GenerativeAIService, AdmissionRejected, INTERACTIVE
+from plan_store import insert_plan, fetch_curriculum, fetch_item, save_subtopics
+from progress_log import apply_changes, record_event, subtopic_value
+from snapshots import archive_current_plan, list_snapshots, restore_snapshot
+from write_queue import run_write
+from search import search_curriculum, MAX_PAGE_SIZE
 
 curriculum_bp = Blueprint('curriculum', __name__)
 
-import json
-
-def generate_personalized_curriculum(user_data):
+def generate_personalized_curriculum(user_data, priority=INTERACTIVE):
     """Generate a personalized curriculum using AI"""
     career_goal = user_data.get('career_goal', 'Software Engineer')
     weak_subjects = user_data.get('weak_subjects', '')
@@ -17,7 +20,7 @@ def generate_personalized_curriculum(user_data):
     hours = user_data.get('hours_per_day', 2.0)
     
     # Call the Generative AI Service
-    ai_curriculum = GenerativeAIService.generate_curriculum(career_goal, weak_subjects, weeks, hours)
+    ai_curriculum = GenerativeAIService.generate_curriculum(career_goal, weak_subjects, weeks, hours, priority=priority)
     
     # Transfer generated list to the expected internal format
     processed_topics = []
@@ -40,16 +43,23 @@ def generate_personalized_curriculum(user_data):
     
     return processed_topics
 
+def overloaded_response(error):
+    """429 telling the client when to retry after admission control turned it away"""
+    response = jsonify({'error': 'AI service is busy, please retry shortly', 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, 429
+
 @curriculum_bp.route('/generate', methods=['POST'])
 def generate_curriculum():
     data = request.json
-    user_id = data.get('user_id')
+    user_id = parse_id(data.get('user_id'))
+    if user_id is None:
+        return jsonify({'error': 'A valid user_id is required'}), 400
     
-    conn = get_db_connection()
-    c = conn.cursor()
+    conn = get_db_connection(user_id)
     
     # Check if curriculum already exists
-    existing = conn.execute('SELECT * FROM curriculum WHERE user_id = ?', (user_id,)).fetchall()
+    existing = conn.execute('SELECT 1 FROM curriculum WHERE user_id = ? LIMIT 1', (user_id,)).fetchone()
     
     if not existing:
         # Get user data for personalization
@@ -57,48 +67,34 @@ def generate_curriculum():
         
         if user_data:
             user_dict = dict(user_data)
-            topics_list = generate_personalized_curriculum(user_dict)
+            try:
+                topics_list = generate_personalized_curriculum(user_dict)
+            except AdmissionRejected as e:
+                conn.close()
+                return overloaded_response(e)
             
-            # Insert generated curriculum
-            for topic, difficulty, estimated_hours, week_number, subtopics in topics_list:
-                subtopics_json = json.dumps(subtopics)
-                c.execute('''INSERT INTO curriculum (user_id, topic, status, difficulty_level, estimated_hours, week_number, subtopics) 
-                             VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                          (user_id, topic, 'pending', difficulty, estimated_hours, week_number, subtopics_json))
-            conn.commit()
-    
-    curriculum = conn.execute('SELECT * FROM curriculum WHERE user_id = ?', (user_id,)).fetchall()
-    conn.close()
+            # Insert generated curriculum as references to shared plan items,
+            # unless a concurrent request got there first
+            def write(conn):
+                if not conn.execute('SELECT 1 FROM curriculum WHERE user_id = ? LIMIT 1', (user_id,)).fetchone():
+                    insert_plan(conn, user_id, topics_list)
+            run_write(write, user_id=user_id)
     
-    result = []
-    for row in curriculum:
-        item = dict(row)
-        if item.get('subtopics'):
-            try:
-                # If existing data is list of strings, convert to objects (migration on read/lazy migration)
-                # But best to rely on regenerate for full structure. 
-                # Here we blindly load. If checks fail frontend might break, so we assume regenerate.
-                item['subtopics'] = json.loads(item['subtopics'])
-            except:
-                item['subtopics'] = []
-        result.append(item)
+    result = fetch_curriculum(conn, user_id)
+    conn.close()
         
     return jsonify(result), 200
 
 @curriculum_bp.route('/regenerate', methods=['POST'])
 def regenerate_curriculum():
-    """Delete existing curriculum and generate a new one"""
+    """Archive the existing curriculum as a snapshot and generate a new one"""
     data = request.json
-    user_id = data.get('user_id')
+    user_id = parse_id(data.get('user_id'))
+    if user_id is None:
+        return jsonify({'error': 'A valid user_id is required'}), 400
     print(f"Regenerate request for user_id: {user_id}")
     
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Delete existing curriculum
-    c.execute('DELETE FROM curriculum WHERE user_id = ?', (user_id,))
-    conn.commit()
-    print("Deleted existing curriculum")
+    conn = get_db_connection(user_id)
     
     # Get user data for personalization
     user_data = conn.execute('SELECT * FROM users WHERE id = ?', (user_id,)).fetchone()
@@ -106,47 +102,80 @@ def regenerate_curriculum():
     if user_data:
         user_dict = dict(user_data)
         print(f"User data found: {user_dict['name']}, goal: {user_dict['career_goal']}")
-        topics_list = generate_personalized_curriculum(user_dict)
+        # Generate before archiving so an overloaded AI service leaves the old plan intact
+        try:
+            topics_list = generate_personalized_curriculum(user_dict)
+        except AdmissionRejected as e:
+            conn.close()
+            return overloaded_response(e)
         print(f"Generated {len(topics_list)} topics")
         
-        # Insert new curriculum
-        for topic, difficulty, estimated_hours, week_number, subtopics in topics_list:
-            subtopics_json = json.dumps(subtopics)
-            c.execute('''INSERT INTO curriculum (user_id, topic, status, difficulty_level, estimated_hours, week_number, subtopics) 
-                         VALUES (?, ?, ?, ?, ?, ?, ?)''',
-                      (user_id, topic, 'pending', difficulty, estimated_hours, week_number, subtopics_json))
-        conn.commit()
+        # Archive existing curriculum and insert the new one as references to shared plan items
+        def write(conn):
+            version = archive_current_plan(conn, user_id)
+            insert_plan(conn, user_id, topics_list)
+            return version
+        version = run_write(write, user_id=user_id)
+        print(f"Archived existing curriculum as snapshot {version}")
         print("Inserted new curriculum into database")
     else:
         print(f"User not found for ID: {user_id}")
     
-    curriculum = conn.execute('SELECT * FROM curriculum WHERE user_id = ?', (user_id,)).fetchall()
+    result = fetch_curriculum(conn, user_id)
     conn.close()
+    return jsonify(result), 200
+
+@curriculum_bp.route('/snapshots', methods=['POST'])
+def get_snapshots():
+    """List a user's archived curriculum versions, newest first"""
+    data = request.json
+    user_id = parse_id(data.get('user_id'))
+    if user_id is None:
+        return jsonify({'error': 'A valid user_id is required'}), 400
     
-    result = []
-    for row in curriculum:
-        item = dict(row)
-        if item.get('subtopics'):
-            try:
-                item['subtopics'] = json.loads(item['subtopics'])
-            except:
-                item['subtopics'] = []
-        result.append(item)
+    conn = get_db_connection(user_id)
+    snapshots = list_snapshots(conn, user_id)
+    conn.close()
+    
+    return jsonify(snapshots), 200
+
+@curriculum_bp.route('/snapshots/restore', methods=['POST'])
+def restore_curriculum_snapshot():
+    """Make an archived version the live curriculum again (the current one is archived first)"""
+    data = request.json
+    user_id = parse_id(data.get('user_id'))
+    version = parse_id(data.get('version'))
+    if user_id is None:
+        return jsonify({'error': 'A valid user_id is required'}), 400
+    if version is None:
+        return jsonify({'error': 'A valid version is required'}), 400
+    
+    if not run_write(lambda conn: restore_snapshot(conn, user_id, version), user_id=user_id):
+        return jsonify({'error': 'Snapshot not found'}), 404
+    
+    conn = get_db_connection(user_id)
+    result = fetch_curriculum(conn, user_id)
+    conn.close()
     return jsonify(result), 200
 
 @curriculum_bp.route('/update-status', methods=['POST'])
 def update_status():
     """Update the status of a curriculum item"""
     data = request.json
-    curriculum_id = data.get('curriculum_id')
+    curriculum_id = parse_id(data.get('curriculum_id'))
     status = data.get('status')
+    if curriculum_id is None:
+        return jsonify({'error': 'A valid curriculum_id is required'}), 400
+    if shard_key(curriculum_id=curriculum_id) == NO_SHARD:
+        return jsonify({'error': 'Item not found'}), 404
     
-    conn = get_db_connection()
-    c = conn.cursor()
+    def write(conn):
+        row = conn.execute('SELECT user_id, status, difficulty_level FROM curriculum WHERE id = ?', (curriculum_id,)).fetchone()
+        conn.execute('UPDATE curriculum SET status = ? WHERE id = ?', (status, curriculum_id))
+        if row:
+            record_event(conn, row['user_id'], curriculum_id, row['difficulty_level'], row['status'], status)
     
-    c.execute('UPDATE curriculum SET status = ? WHERE id = ?', (status, curriculum_id))
-    conn.commit()
-    conn.close()
+    run_write(write, curriculum_id=curriculum_id)
     
     return jsonify({'message': 'Status updated successfully'}), 200
 
@@ -154,61 +183,113 @@ def update_status():
 def update_subtopic_status():
     """Update the completion status of a specific subtopic"""
     data = request.json
-    curriculum_id = data.get('curriculum_id')
+    curriculum_id = parse_id(data.get('curriculum_id'))
     subtopic_index = data.get('subtopic_index')
     completed = data.get('completed')
-    
-    conn = get_db_connection()
-    c = conn.cursor()
-    
-    # Get current subtopics
-    row = c.execute('SELECT subtopics, status FROM curriculum WHERE id = ?', (curriculum_id,)).fetchone()
-    if not row:
-        conn.close()
+    if curriculum_id is None:
+        return jsonify({'error': 'A valid curriculum_id is required'}), 400
+    if shard_key(curriculum_id=curriculum_id) == NO_SHARD:
         return jsonify({'error': 'Item not found'}), 404
+    
+    def write(conn):
+        # Get current subtopics (merged with this user's progress overlay)
+        item = fetch_item(conn, curriculum_id)
+        if not item:
+            return {'error': 'Item not found'}, 404
         
-    try:
-        subtopics = json.loads(row['subtopics'])
+        subtopics = item['subtopics']
         
         # Update the specific subtopic
-        if 0 <= subtopic_index < len(subtopics):
-            # Check if stored as string (legacy) or dict (new)
-            if isinstance(subtopics[subtopic_index], str):
-                # Convert to dict if legacy
-                subtopics[subtopic_index] = {'title': subtopics[subtopic_index], 'completed': completed}
-            else:
-                subtopics[subtopic_index]['completed'] = completed
-                
-            # Check if ALL subtopics are completed
-            all_done = all(
-                st.get('completed', False) if isinstance(st, dict) else False 
-                for st in subtopics
-            )
-            
-            # Optionally auto-complete the parent topic
-            new_parent_status = row['status']
-            if all_done and row['status'] != 'completed':
-                new_parent_status = 'completed'
-                c.execute('UPDATE curriculum SET status = ? WHERE id = ?', ('completed', curriculum_id))
-            
-            # Save updated subtopics
-            c.execute('UPDATE curriculum SET subtopics = ? WHERE id = ?', (json.dumps(subtopics), curriculum_id))
-            conn.commit()
-            
-            conn.close()
-            return jsonify({
-                'message': 'Subtopic updated', 
-                'parent_completed': new_parent_status == 'completed',
-                'subtopics': subtopics
-            }), 200
+        if not 0 <= subtopic_index < len(subtopics):
+            return {'error': 'Invalid subtopic index'}, 400
+        
+        was_completed = isinstance(subtopics[subtopic_index], dict) and subtopics[subtopic_index].get('completed', False)
+        
+        # Check if stored as string (legacy) or dict (new)
+        if isinstance(subtopics[subtopic_index], str):
+            # Convert to dict if legacy
+            subtopics[subtopic_index] = {'title': subtopics[subtopic_index], 'completed': completed}
         else:
-            conn.close()
-            return jsonify({'error': 'Invalid subtopic index'}), 400
+            subtopics[subtopic_index]['completed'] = completed
             
+        # Check if ALL subtopics are completed
+        all_done = all(
+            st.get('completed', False) if isinstance(st, dict) else False 
+            for st in subtopics
+        )
+        
+        # Optionally auto-complete the parent topic
+        new_parent_status = item['status']
+        if all_done and item['status'] != 'completed':
+            new_parent_status = 'completed'
+            conn.execute('UPDATE curriculum SET status = ? WHERE id = ?', ('completed', curriculum_id))
+        
+        # Save updated subtopics; shared plan content is never modified
+        save_subtopics(conn, curriculum_id, subtopics)
+        
+        record_event(conn, item['user_id'], curriculum_id, item['difficulty_level'],
+                     subtopic_value(was_completed), subtopic_value(completed), subtopic_index)
+        record_event(conn, item['user_id'], curriculum_id, item['difficulty_level'], item['status'], new_parent_status)
+        
+        return {
+            'message': 'Subtopic updated', 
+            'parent_completed': new_parent_status == 'completed',
+            'subtopics': subtopics
+        }, 200
+    
+    try:
+        body, status_code = run_write(write, curriculum_id=curriculum_id)
+        return jsonify(body), status_code
     except Exception as e:
-        conn.close()
         return jsonify({'error': str(e)}), 500
 
+@curriculum_bp.route('/batch-update', methods=['POST'])
+def batch_update():
+    """Apply many status / subtopic changes for one user in a single transaction"""
+    data = request.json
+    user_id = parse_id(data.get('user_id'))
+    changes = data.get('changes', [])
+    
+    if user_id is None:
+        return jsonify({'error': 'A valid user_id is required'}), 400
+    
+    if not isinstance(changes, list) or not changes:
+        return jsonify({'error': 'No changes given'}), 400
+    for change in changes:
+        if not isinstance(change, dict) or parse_id(change.get('curriculum_id')) is None:
+            return jsonify({'error': 'Each change must be an object with an integer curriculum_id'}), 400
+    changes = [dict(change, curriculum_id=parse_id(change['curriculum_id'])) for change in changes]
+    
+    body, status_code = run_write(lambda conn: apply_changes(conn, user_id, changes), user_id=user_id)
+    return jsonify(body), status_code
+
+@curriculum_bp.route('/search', methods=['GET'])
+def search():
+    """Ranked, paginated full-text search over topic and subtopic titles.
+
+    Scoped to one user with user_id, or to a cohort with branch and/or career_goal.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({'error': 'Query parameter q is required'}), 400
+    
+    user_id = None
+    if 'user_id' in request.args:
+        user_id = parse_id(request.args['user_id'])
+        if user_id is None:
+            return jsonify({'error': 'user_id must be an integer'}), 400
+    try:
+        limit = max(1, min(int(request.args.get('limit', 20)), MAX_PAGE_SIZE))
+        offset = max(0, int(request.args.get('offset', 0)))
+    except ValueError:
+        return jsonify({'error': 'limit and offset must be integers'}), 400
+    
+    results = search_curriculum(query, user_id=user_id,
+                                branch=request.args.get('branch'),
+                                career_goal=request.args.get('career_goal'),
+                                limit=limit, offset=offset)
+    return jsonify({'results': results, 'limit': limit, 'offset': offset}), 200
+
 @curriculum_bp.route('/download', methods=['POST'])
 def download_curriculum():
     data = request.json
@@ -3,15 +3,175 @@ import os
 
 DB_NAME = "smart_curriculum.db"
 
-def get_db_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def init_db():
-    conn = get_db_connection()
-    c = conn.cursor()
-    
+# Number of SQLite files per-user data is spread over. With 1 (the default)
+# everything lives in DB_NAME as before.
+DB_SHARDS = int(os.getenv("DB_SHARDS", "1"))
+
+# Curriculum ids are allocated in disjoint ranges per shard, so an id alone
+# tells us which file the row lives in.
+SHARD_ID_SPAN = 10 ** 12
+
+# shard_key() of a curriculum id outside every shard's range; no file holds it
+NO_SHARD = -1
+
+
+class SingleFileBackend:
+    """All tables in one SQLite file"""
+
+    def __init__(self, db_path=DB_NAME):
+        self.db_path = db_path
+        self.shard_count = 1
+
+    def shard_for_user(self, user_id):
+        return 0
+
+    def shard_for_curriculum(self, curriculum_id):
+        return 0
+
+    def shard_path(self, shard):
+        return self.db_path
+
+    def shard_paths(self):
+        return [self.db_path]
+
+    def connect(self, shard=None):
+        conn = sqlite3.connect(self.db_path)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+class ShardedBackend:
+    """Global tables (users, profile terms) in a directory file, per-user tables in N shard files.
+
+    Shard connections ATTACH the directory, so queries that join per-user
+    rows with users keep working unchanged.
+    """
+
+    def __init__(self, shard_count, directory_path=DB_NAME):
+        self.db_path = directory_path
+        self.shard_count = shard_count
+
+    def shard_for_user(self, user_id):
+        return int(user_id) % self.shard_count
+
+    def shard_for_curriculum(self, curriculum_id):
+        """Shard whose id range holds curriculum_id, or None when no shard does"""
+        shard = int(curriculum_id) // SHARD_ID_SPAN
+        return shard if 0 <= shard < self.shard_count else None
+
+    def shard_path(self, shard):
+        base, ext = os.path.splitext(self.db_path)
+        return f"{base}.shard{shard}{ext}"
+
+    def shard_paths(self):
+        return [self.shard_path(shard) for shard in range(self.shard_count)]
+
+    def connect(self, shard=None):
+        if shard is None:
+            conn = sqlite3.connect(self.db_path)
+        elif not 0 <= shard < self.shard_count:
+            # sqlite3 would quietly create the missing file
+            raise ValueError(f"No shard {shard} in a {self.shard_count}-shard database")
+        else:
+            conn = sqlite3.connect(self.shard_path(shard))
+            conn.execute('ATTACH DATABASE ? AS directory', (self.db_path,))
+        conn.row_factory = sqlite3.Row
+        return conn
+
+
+def make_backend(shard_count=DB_SHARDS, db_path=DB_NAME):
+    if shard_count > 1:
+        return ShardedBackend(shard_count, db_path)
+    return SingleFileBackend(db_path)
+
+
+backend = make_backend()
+
+
+def shard_key(user_id=None, curriculum_id=None):
+    """Shard index holding a user's or curriculum row's data; None means the directory file"""
+    if backend.shard_count == 1:
+        return None
+    if curriculum_id is not None:
+        shard = backend.shard_for_curriculum(curriculum_id)
+        return NO_SHARD if shard is None else shard
+    if user_id is not None:
+        return backend.shard_for_user(user_id)
+    return None
+
+
+def parse_id(value):
+    """A user or curriculum id from request data as an int, or None when missing or malformed"""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, int):
+        return value
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value)
+    return None
+
+
+def get_db_connection(user_id=None, db_path=None):
+    """Connection holding user_id's rows (or the global tables when user_id is None)"""
+    if db_path is not None:
+        return SingleFileBackend(db_path).connect()
+    return backend.connect(shard_key(user_id=user_id))
+
+
+def shard_keys():
+    """shard_key of every file holding per-user rows"""
+    if backend.shard_count == 1:
+        return [None]
+    return list(range(backend.shard_count))
+
+
+def iter_shard_connections():
+    """One connection per shard, for global queries that fan out over all users' rows"""
+    for key in shard_keys():
+        conn = backend.connect(key)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+
+def init_db(db_path=None):
+    if db_path is not None or backend.shard_count == 1:
+        conn = get_db_connection(db_path=db_path or backend.db_path)
+        _enable_incremental_vacuum(conn)
+        _create_directory_tables(conn.cursor())
+        _create_user_tables(conn.cursor())
+        conn.commit()
+        conn.close()
+    else:
+        conn = backend.connect()
+        _create_directory_tables(conn.cursor())
+        conn.commit()
+        conn.close()
+        for shard in range(backend.shard_count):
+            init_shard_file(backend.shard_path(shard), shard)
+    print("Database initialized successfully.")
+
+
+def init_shard_file(db_path, shard):
+    """Create the per-user tables in one shard file"""
+    conn = get_db_connection(db_path=db_path)
+    _enable_incremental_vacuum(conn)
+    _create_user_tables(conn.cursor(), shard)
+    conn.commit()
+    conn.close()
+
+
+def _enable_incremental_vacuum(conn):
+    """Let the compaction job hand freed pages back.
+
+    Only takes effect before the first table is created in a file (or at
+    the next VACUUM), so it must run before any CREATE.
+    """
+    conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+
+
+def _create_directory_tables(c):
     # User Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -30,6 +190,33 @@ def init_db():
         )
     ''')
 
+    # Profile Terms Table - per-term user counts for skills, weak subjects and career goals
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS profile_terms (
+            kind TEXT NOT NULL, -- 'skill', 'weak_subject' or 'career_goal'
+            name TEXT NOT NULL, -- normalized (lowercase) term
+            display_name TEXT NOT NULL,
+            user_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (kind, name)
+        )
+    ''')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_profile_terms_rank ON profile_terms (kind, user_count DESC)')
+
+    # Generation Cache Table - model output per (career goal, weeks, hours) before weak-subject tailoring
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS generation_cache (
+            career_goal TEXT NOT NULL, -- normalized (lowercase) goal
+            weeks INTEGER NOT NULL,
+            hours_per_day REAL NOT NULL,
+            created_at INTEGER NOT NULL,
+            payload BLOB NOT NULL, -- zlib-compressed JSON list of topics
+            PRIMARY KEY (career_goal, weeks, hours_per_day)
+        )
+    ''')
+
+
+def _create_user_tables(c, shard=0):
     # Curriculum Table
     c.execute('''
         CREATE TABLE IF NOT EXISTS curriculum (
@@ -41,14 +228,164 @@ def init_db():
             estimated_hours REAL DEFAULT 0,
             week_number INTEGER DEFAULT 1,
             subtopics TEXT,
-            FOREIGN KEY (user_id) REFERENCES users (id)
+            plan_item_id INTEGER,
+            progress TEXT,
+            branch TEXT, -- copied from users so cohort searches can use an index
+            career_goal TEXT,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (plan_item_id) REFERENCES shared_plan_items (id)
         )
     ''')
 
-    conn.commit()
-    conn.close()
-    print("Database initialized successfully.")
+    # Databases created before shared plans existed lack the reference columns
+    _add_missing_columns(c, 'curriculum', (('plan_item_id', 'INTEGER'), ('progress', 'TEXT'),
+                                           ('branch', 'TEXT'), ('career_goal', 'TEXT')))
+
+    # Shared Plan Items Table - immutable, content-addressed topic text shared by all users
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS shared_plan_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            content_hash TEXT NOT NULL UNIQUE,
+            topic TEXT NOT NULL,
+            subtopics TEXT -- JSON list of subtopic titles
+        )
+    ''')
+
+    # Progress Events Table - append-only log of status and subtopic transitions
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS progress_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at INTEGER NOT NULL, -- unix seconds
+            user_id INTEGER NOT NULL,
+            curriculum_id INTEGER NOT NULL,
+            difficulty_level TEXT,
+            subtopic_index INTEGER, -- NULL for topic status changes
+            old_value TEXT,
+            new_value TEXT,
+            branch TEXT -- the user's branch when the event was written
+        )
+    ''')
+    _add_missing_columns(c, 'progress_events', (('branch', 'TEXT'),))
+
+    # Progress Rollups Table - hourly/daily aggregates maintained by progress_log.run_rollup
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS progress_rollups (
+            bucket TEXT NOT NULL, -- 'hour' or 'day'
+            bucket_start INTEGER NOT NULL,
+            user_id INTEGER NOT NULL, -- 0 aggregates all users
+            branch TEXT NOT NULL,
+            difficulty_level TEXT NOT NULL,
+            topics_completed INTEGER DEFAULT 0,
+            topics_reopened INTEGER DEFAULT 0,
+            subtopics_completed INTEGER DEFAULT 0,
+            subtopics_reopened INTEGER DEFAULT 0,
+            active_users INTEGER DEFAULT 0, -- distinct users with any event; '*' rows cover every branch/difficulty
+            PRIMARY KEY (bucket, user_id, bucket_start, branch, difficulty_level)
+        )
+    ''')
+    _add_missing_columns(c, 'progress_rollups', (('active_users', 'INTEGER DEFAULT 0'),))
+
+    # Curriculum Snapshots Table - one zlib-compressed JSON copy of each archived plan
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS curriculum_snapshots (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            version INTEGER NOT NULL,
+            created_at INTEGER NOT NULL, -- unix seconds
+            item_count INTEGER NOT NULL,
+            payload BLOB NOT NULL,
+            UNIQUE (user_id, version)
+        )
+    ''')
+
+    c.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            name TEXT PRIMARY KEY,
+            last_event_id INTEGER NOT NULL
+        )
+    ''')
+
+    c.execute('CREATE INDEX IF NOT EXISTS idx_curriculum_user ON curriculum (user_id)')
+    # Expanding a matched shared item to the rows of one cohort
+    c.execute('DROP INDEX IF EXISTS idx_curriculum_plan_item')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_curriculum_plan_item_branch ON curriculum (plan_item_id, branch)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_curriculum_plan_item_goal ON curriculum (plan_item_id, career_goal)')
+
+    _create_search_index(c)
+
+    # Start each shard's curriculum ids in its own range (see SHARD_ID_SPAN)
+    if shard and not c.execute("SELECT 1 FROM sqlite_sequence WHERE name = 'curriculum'").fetchone():
+        c.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('curriculum', ?)", (shard * SHARD_ID_SPAN,))
+
+
+def _add_missing_columns(c, table, columns):
+    existing_columns = {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+    for col_name, col_type in columns:
+        if col_name not in existing_columns:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN {col_name} {col_type}")
+
+
+# Subtopic titles from a curriculum/shared item subtopics JSON column
+SUBTOPIC_TITLES_SQL = """(SELECT group_concat(CASE WHEN type = 'object' THEN json_extract(value, '$.title') ELSE value END, ' ')
+                          FROM json_each(CASE WHEN json_valid({column}) THEN {column} ELSE '[]' END))"""
+
+
+def _create_search_index(c):
+    """FTS5 indexes over topic and subtopic titles, kept in sync by triggers.
+
+    Shared plan items are indexed once per distinct content; only private
+    (non-shared) curriculum rows are indexed individually.
+    """
+    existing = {row[0] for row in c.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS shared_plan_items_fts USING fts5 (topic, subtopics, prefix = '2 3')")
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS curriculum_fts USING fts5 (topic, subtopics, prefix = '2 3')")
+    # Per-term document counts, so search can score across tables and shards
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS shared_plan_items_fts_terms USING fts5vocab (shared_plan_items_fts, 'row')")
+    c.execute("CREATE VIRTUAL TABLE IF NOT EXISTS curriculum_fts_terms USING fts5vocab (curriculum_fts, 'row')")
+
+    new_titles = SUBTOPIC_TITLES_SQL.format(column='new.subtopics')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS shared_plan_items_fts_insert AFTER INSERT ON shared_plan_items BEGIN
+            INSERT INTO shared_plan_items_fts (rowid, topic, subtopics) VALUES (new.id, new.topic, {new_titles});
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS shared_plan_items_fts_delete AFTER DELETE ON shared_plan_items BEGIN
+            DELETE FROM shared_plan_items_fts WHERE rowid = old.id;
+        END
+    ''')
+
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS curriculum_fts_insert AFTER INSERT ON curriculum
+        WHEN new.plan_item_id IS NULL BEGIN
+            INSERT INTO curriculum_fts (rowid, topic, subtopics) VALUES (new.id, new.topic, {new_titles});
+        END
+    ''')
+    c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS curriculum_fts_update AFTER UPDATE OF topic, subtopics, plan_item_id ON curriculum
+        WHEN old.topic IS NOT new.topic OR old.subtopics IS NOT new.subtopics OR old.plan_item_id IS NOT new.plan_item_id BEGIN
+            DELETE FROM curriculum_fts WHERE rowid = old.id;
+            INSERT INTO curriculum_fts (rowid, topic, subtopics)
+            SELECT new.id, new.topic, {new_titles} WHERE new.plan_item_id IS NULL;
+        END
+    ''')
+    c.execute('''
+        CREATE TRIGGER IF NOT EXISTS curriculum_fts_delete AFTER DELETE ON curriculum
+        WHEN old.plan_item_id IS NULL BEGIN
+            DELETE FROM curriculum_fts WHERE rowid = old.id;
+        END
+    ''')
+
+    # Index rows that existed before the search tables did
+    if 'shared_plan_items_fts' not in existing:
+        titles = SUBTOPIC_TITLES_SQL.format(column='subtopics')
+        c.execute(f"INSERT INTO shared_plan_items_fts (rowid, topic, subtopics) SELECT id, topic, {titles} FROM shared_plan_items")
+    if 'curriculum_fts' not in existing:
+        titles = SUBTOPIC_TITLES_SQL.format(column='subtopics')
+        c.execute(f"""INSERT INTO curriculum_fts (rowid, topic, subtopics)
+                      SELECT id, topic, {titles} FROM curriculum WHERE plan_item_id IS NULL""")
+
 
 if __name__ == '__main__':
     init_db()
-
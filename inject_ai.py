@@ -1,106 +1,250 @@
-import sqlite3
-import json
+import argparse
+import random
+import time
+from database import backend, get_db_connection, init_db, shard_key
+from plan_store import insert_item, get_or_create_plan_item
+from snapshots import archive_current_plan
+from skill_stats import backfill
+from ai_service import GenerativeAIService
+
+# Professional 6-week Software Developer Roadmap
+ROADMAP = [
+    {
+        "topic": "Frontend Fundamentals & Modern UI",
+        "difficulty_level": "Easy",
+        "estimated_hours": 20,
+        "week_number": 1,
+        "subtopics": [
+            {"title": "HTML5 Semantic Structure", "completed": False},
+            {"title": "CSS3 Flexbox & Grid Layouts", "completed": False},
+            {"title": "Responsive Design Principles", "completed": False},
+            {"title": "Introduction to React.js Components", "completed": False}
+        ]
+    },
+    {
+        "topic": "JavaScript Mastery & Logic",
+        "difficulty_level": "Medium",
+        "estimated_hours": 24,
+        "week_number": 2,
+        "subtopics": [
+            {"title": "ES6+ Syntax (Arrow functions, Destructuring)", "completed": False},
+            {"title": "Asynchronous JS (Promises & Async/Await)", "completed": False},
+            {"title": "DOM Manipulation & Event Handling", "completed": False},
+            {"title": "State Management Basics", "completed": False}
+        ]
+    },
+    {
+        "topic": "Backend Development & APIs",
+        "difficulty_level": "Medium",
+        "estimated_hours": 28,
+        "week_number": 3,
+        "subtopics": [
+            {"title": "Node.js & Express Server Setup", "completed": False},
+            {"title": "RESTful API Design Patterns", "completed": False},
+            {"title": "Middleware & Error Handling", "completed": False},
+            {"title": "Postman for API Testing", "completed": False}
+        ]
+    },
+    {
+        "topic": "Database Systems & Data Modeling",
+        "difficulty_level": "Hard",
+        "estimated_hours": 25,
+        "week_number": 4,
+        "subtopics": [
+            {"title": "SQL Basics & Relational Databases", "completed": False},
+            {"title": "MongoDB & NoSQL Concepts", "completed": False},
+            {"title": "ORM/ODM (Sequelize or Mongoose)", "completed": False},
+            {"title": "Database Normalization", "completed": False}
+        ]
+    },
+    {
+        "topic": "DevOps, Git & Deployment",
+        "difficulty_level": "Medium",
+        "estimated_hours": 20,
+        "week_number": 5,
+        "subtopics": [
+            {"title": "Advanced Git (Rebase, Cherry-pick)", "completed": False},
+            {"title": "Docker Containers & Microservices", "completed": False},
+            {"title": "CI/CD Pipelines (GitHub Actions)", "completed": False},
+            {"title": "Cloud Deployment (AWS/Vercel/Heroku)", "completed": False}
+        ]
+    },
+    {
+        "topic": "Capstone Project & System Design",
+        "difficulty_level": "Hard",
+        "estimated_hours": 30,
+        "week_number": 6,
+        "subtopics": [
+            {"title": "Full-stack Project Integration", "completed": False},
+            {"title": "Scalability & Performance Optimization", "completed": False},
+            {"title": "Security Best Practices (JWT, OAuth)", "completed": False},
+            {"title": "Technical Interview Preparation", "completed": False}
+        ]
+    }
+]
 
 def inject_curriculum():
-    conn = sqlite3.connect('backend/smart_curriculum.db')
-    conn.row_factory = sqlite3.Row
+    conn = get_db_connection()
     
     # Get the latest user
     user = conn.execute('SELECT id, career_goal FROM users ORDER BY id DESC LIMIT 1').fetchone()
+    conn.close()
     if not user:
         print("No user found.")
         return
     
     user_id = user['id']
+    conn = get_db_connection(user_id)
     
-    # Clear existing
-    conn.execute('DELETE FROM curriculum WHERE user_id = ?', (user_id,))
-    
-    # Professional 6-week Software Developer Roadmap
-    roadmap = [
-        {
-            "topic": "Frontend Fundamentals & Modern UI",
-            "difficulty_level": "Easy",
-            "estimated_hours": 20,
-            "week_number": 1,
-            "subtopics": [
-                {"title": "HTML5 Semantic Structure", "completed": False},
-                {"title": "CSS3 Flexbox & Grid Layouts", "completed": False},
-                {"title": "Responsive Design Principles", "completed": False},
-                {"title": "Introduction to React.js Components", "completed": False}
-            ]
-        },
-        {
-            "topic": "JavaScript Mastery & Logic",
-            "difficulty_level": "Medium",
-            "estimated_hours": 24,
-            "week_number": 2,
-            "subtopics": [
-                {"title": "ES6+ Syntax (Arrow functions, Destructuring)", "completed": False},
-                {"title": "Asynchronous JS (Promises & Async/Await)", "completed": False},
-                {"title": "DOM Manipulation & Event Handling", "completed": False},
-                {"title": "State Management Basics", "completed": False}
-            ]
-        },
-        {
-            "topic": "Backend Development & APIs",
-            "difficulty_level": "Medium",
-            "estimated_hours": 28,
-            "week_number": 3,
-            "subtopics": [
-                {"title": "Node.js & Express Server Setup", "completed": False},
-                {"title": "RESTful API Design Patterns", "completed": False},
-                {"title": "Middleware & Error Handling", "completed": False},
-                {"title": "Postman for API Testing", "completed": False}
-            ]
-        },
-        {
-            "topic": "Database Systems & Data Modeling",
-            "difficulty_level": "Hard",
-            "estimated_hours": 25,
-            "week_number": 4,
-            "subtopics": [
-                {"title": "SQL Basics & Relational Databases", "completed": False},
-                {"title": "MongoDB & NoSQL Concepts", "completed": False},
-                {"title": "ORM/ODM (Sequelize or Mongoose)", "completed": False},
-                {"title": "Database Normalization", "completed": False}
-            ]
-        },
-        {
-            "topic": "DevOps, Git & Deployment",
-            "difficulty_level": "Medium",
-            "estimated_hours": 20,
-            "week_number": 5,
-            "subtopics": [
-                {"title": "Advanced Git (Rebase, Cherry-pick)", "completed": False},
-                {"title": "Docker Containers & Microservices", "completed": False},
-                {"title": "CI/CD Pipelines (GitHub Actions)", "completed": False},
-                {"title": "Cloud Deployment (AWS/Vercel/Heroku)", "completed": False}
-            ]
-        },
-        {
-            "topic": "Capstone Project & System Design",
-            "difficulty_level": "Hard",
-            "estimated_hours": 30,
-            "week_number": 6,
-            "subtopics": [
-                {"title": "Full-stack Project Integration", "completed": False},
-                {"title": "Scalability & Performance Optimization", "completed": False},
-                {"title": "Security Best Practices (JWT, OAuth)", "completed": False},
-                {"title": "Technical Interview Preparation", "completed": False}
-            ]
-        }
-    ]
+    # Archive existing plan so it can be restored later
+    archive_current_plan(conn, user_id)
     
-    for item in roadmap:
-        conn.execute('''
-            INSERT INTO curriculum (user_id, topic, status, difficulty_level, estimated_hours, week_number, subtopics)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (user_id, item['topic'], 'pending', item['difficulty_level'], item['estimated_hours'], item['week_number'], json.dumps(item['subtopics'])))
+    for item in ROADMAP:
+        insert_item(conn, user_id, item['topic'], item['difficulty_level'], item['estimated_hours'], item['week_number'], item['subtopics'])
     
     conn.commit()
     conn.close()
     print(f"Successfully activated AI curriculum for user {user_id}")
 
+# Synthetic population for performance work: (value, weight) pairs
+SEED_CAREER_GOALS = [
+    ("Software Engineer", 30), ("Data Scientist", 20), ("Full Stack Developer", 12),
+    ("Machine Learning Engineer", 8), ("UI/UX Designer", 8), ("DevOps Engineer", 6),
+    ("Product Manager", 5), ("Cybersecurity Analyst", 4), ("Cloud Architect", 4), ("Game Developer", 3),
+]
+SEED_WEEKS = [(4, 10), (6, 15), (8, 35), (10, 10), (12, 20), (16, 7), (24, 3)]
+SEED_HOURS = [(1.0, 15), (1.5, 10), (2.0, 40), (3.0, 20), (4.0, 15)]
+SEED_BRANCHES = [("CSE", 40), ("IT", 20), ("ECE", 15), ("EEE", 10), ("ME", 8), ("CE", 7)]
+SEED_SUBJECTS = ["Python", "Mathematics", "Statistics", "SQL", "JavaScript", "Data Structures",
+                 "Algorithms", "Networking", "Operating Systems", "Linear Algebra", "Communication"]
+
+def _weighted(rng, pairs):
+    values, weights = zip(*pairs)
+    return rng.choices(values, weights)[0]
+
+def _plan_template(seed, career_goal, weeks, hours):
+    """Deterministic plan for a (goal, weeks, hours) combination, built by the mock generator"""
+    random.seed(f"{seed}:{career_goal}:{weeks}:{hours}")
+    return GenerativeAIService._mock_ai_generate(career_goal, '', weeks, hours)
+
+def _progress_rows(rng, user_id, template, plan_item_ids, branch, career_goal):
+    """Curriculum rows for one user with a realistic completion state.
+
+    Engagement is skewed low: most users are a week or two in, a few
+    finish everything, and the current week is partly done. Topics are
+    only ever 'pending' or 'completed', as in the app.
+    """
+    done_weeks = int(rng.betavariate(0.8, 1.6) * (len(template) + 1))
+    rows = []
+    for item, plan_item_id in zip(template, plan_item_ids):
+        subtopic_count = len(item['subtopics'])
+        if item['week_number'] <= done_weeks:
+            status, progress = 'completed', '1' * subtopic_count
+        elif item['week_number'] == done_weeks + 1:
+            done = rng.randint(0, subtopic_count - 1)
+            status, progress = 'pending', '1' * done + '0' * (subtopic_count - done)
+        else:
+            status, progress = 'pending', '0' * subtopic_count
+        rows.append((user_id, '', status, item['difficulty_level'], item['estimated_hours'],
+                     item['week_number'], None, plan_item_id, progress, branch, career_goal))
+    return rows
+
+def _relax(conn):
+    """Trade durability for load speed; returns the settings to restore"""
+    previous = (conn.execute('PRAGMA synchronous').fetchone()[0], conn.execute('PRAGMA journal_mode').fetchone()[0])
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    conn.execute('PRAGMA cache_size = -65536')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return previous
+
+def _restore(conn, previous):
+    synchronous, journal_mode = previous
+    conn.execute(f'PRAGMA journal_mode = {journal_mode}')
+    conn.execute(f'PRAGMA synchronous = {synchronous}')
+
+def seed_database(users, seed=42, chunk_size=5000):
+    """Insert `users` synthetic users and their curricula in chunked executemany transactions"""
+    # Works on a fresh database path as well as an existing one
+    init_db()
+    rng = random.Random(seed)
+    directory = get_db_connection()
+    connections = {None: directory}
+    for shard in range(backend.shard_count):
+        key = shard_key(user_id=shard)
+        if key not in connections:
+            connections[key] = get_db_connection(shard)
+    settings = {key: _relax(conn) for key, conn in connections.items()}
+
+    first_id = (directory.execute('SELECT MAX(id) FROM users').fetchone()[0] or 0) + 1
+    templates = {}
+    plan_items = {}
+    started = time.perf_counter()
+    user_total = 0
+    curriculum_total = 0
+
+    for chunk_start in range(first_id, first_id + users, chunk_size):
+        chunk_end = min(chunk_start + chunk_size, first_id + users)
+        user_rows = []
+        curriculum_rows = {}
+        for user_id in range(chunk_start, chunk_end):
+            career_goal = _weighted(rng, SEED_CAREER_GOALS)
+            weeks = _weighted(rng, SEED_WEEKS)
+            hours = _weighted(rng, SEED_HOURS)
+            weak_subjects = ', '.join(rng.sample(SEED_SUBJECTS, rng.choice((0, 1, 1, 2))))
+            skills = ', '.join(rng.sample(SEED_SUBJECTS, rng.randint(1, 4)))
+            branch = _weighted(rng, SEED_BRANCHES)
+            user_rows.append((user_id, f"Seed User {user_id}", f"seed{seed}.user{user_id}@example.com", "seeded",
+                              career_goal, skills, weak_subjects, weeks, hours, branch))
+
+            combo = (career_goal, weeks, hours)
+            if combo not in templates:
+                templates[combo] = _plan_template(seed, *combo)
+            template = templates[combo]
+
+            # Shared plan items are looked up once per shard and plan
+            key = shard_key(user_id=user_id)
+            ids = plan_items.get((key, combo))
+            if ids is None:
+                ids = [get_or_create_plan_item(connections[key], item['topic'], item['subtopics']) for item in template]
+                plan_items[(key, combo)] = ids
+            curriculum_rows.setdefault(key, []).extend(_progress_rows(rng, user_id, template, ids, branch, career_goal))
+
+        directory.executemany('''INSERT INTO users (id, name, email, password, career_goal, skills, weak_subjects, weeks_available, hours_per_day, branch)
+                                 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', user_rows)
+        directory.commit()
+        for key, rows in curriculum_rows.items():
+            connections[key].executemany('''INSERT INTO curriculum (user_id, topic, status, difficulty_level, estimated_hours, week_number, subtopics, plan_item_id, progress,
+                                                                    branch, career_goal)
+                                            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''', rows)
+            connections[key].commit()
+            curriculum_total += len(rows)
+        user_total += len(user_rows)
+
+        elapsed = time.perf_counter() - started
+        print(f"{user_total} users, {curriculum_total} curriculum rows "
+              f"({(user_total + curriculum_total) / elapsed:,.0f} rows/s)")
+
+    print(f"Backfilled {backfill(directory)} profile terms.")
+    directory.commit()
+    for key, conn in connections.items():
+        _restore(conn, settings[key])
+        conn.close()
+
+    elapsed = time.perf_counter() - started
+    print(f"Seeded {user_total} users and {curriculum_total} curriculum rows from {len(templates)} distinct plans "
+          f"in {elapsed:.1f}s ({(user_total + curriculum_total) / elapsed:,.0f} rows/s)")
+
 if __name__ == "__main__":
-    inject_curriculum()
+    parser = argparse.ArgumentParser(description="Activate the sample roadmap for the latest user, or seed synthetic data")
+    subparsers = parser.add_subparsers(dest='command')
+    seed_parser = subparsers.add_parser('seed', help="Generate synthetic users and curricula")
+    seed_parser.add_argument('--users', type=int, default=100000)
+    seed_parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data")
+    seed_parser.add_argument('--chunk-size', type=int, default=5000, help="Users per transaction")
+    args = parser.parse_args()
+
+    if args.command == 'seed':
+        seed_database(args.users, args.seed, args.chunk_size)
+    else:
+        inject_curriculum()
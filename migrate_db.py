@@ -1,5 +1,8 @@
 import sqlite3
 import os
+from database import init_db
+from plan_store import dedupe_existing_rows, sync_all_profile_columns
+from skill_stats import backfill
 
 DB_NAME = "smart_curriculum.db"
 
@@ -34,6 +37,26 @@ def migrate():
                 
     conn.commit()
     conn.close()
+
+    # Creates shared_plan_items and the curriculum reference columns if missing
+    init_db(db_path)
+
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    converted = dedupe_existing_rows(conn)
+    conn.commit()
+    distinct = conn.execute('SELECT COUNT(*) FROM shared_plan_items').fetchone()[0]
+    print(f"Moved {converted} curriculum rows onto {distinct} shared plan items.")
+    print(f"Copied branch and career goal onto {sync_all_profile_columns(conn)} curriculum rows.")
+    conn.commit()
+    print(f"Backfilled {backfill(conn)} profile terms.")
+    conn.commit()
+    conn.close()
+
+    # Reclaim the space freed by dropping the per-row copies
+    conn = sqlite3.connect(db_path)
+    conn.execute('VACUUM')
+    conn.close()
     print("Migration completed.")
 
 if __name__ == "__main__":
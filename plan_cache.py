@@ -0,0 +1,54 @@
+import os
+import time
+from database import get_db_connection
+from snapshots import compress_items, decompress_items
+from write_queue import run_write
+
+# Model-generated curricula keyed by (career goal, weeks, hours per day).
+# Entries hold the plan generated without weak subjects; callers tailor a
+# copy to each user. warmup.py fills the popular combinations ahead of time.
+
+# Entries older than this are regenerated on the next miss or warm-up run
+GENERATION_CACHE_TTL_HOURS = float(os.getenv("GENERATION_CACHE_TTL_HOURS", "168"))
+
+
+def cache_key(career_goal, weeks, hours_per_day):
+    return ' '.join((career_goal or '').split()).lower(), int(weeks), float(hours_per_day)
+
+
+def is_fresh(created_at, ttl_hours=GENERATION_CACHE_TTL_HOURS):
+    return created_at >= time.time() - ttl_hours * 3600
+
+
+def lookup(career_goal, weeks, hours_per_day):
+    """The cached base plan for a combination, or None if missing or stale"""
+    conn = get_db_connection()
+    row = conn.execute('''SELECT created_at, payload FROM generation_cache
+                          WHERE career_goal = ? AND weeks = ? AND hours_per_day = ?''',
+                       cache_key(career_goal, weeks, hours_per_day)).fetchone()
+    conn.close()
+    if not row or not is_fresh(row['created_at']):
+        return None
+    return decompress_items(row['payload'])
+
+
+def cached_keys(ttl_hours=GENERATION_CACHE_TTL_HOURS):
+    """Keys of every fresh entry"""
+    conn = get_db_connection()
+    rows = conn.execute('SELECT career_goal, weeks, hours_per_day FROM generation_cache WHERE created_at >= ?',
+                        (time.time() - ttl_hours * 3600,)).fetchall()
+    conn.close()
+    return {tuple(row) for row in rows}
+
+
+def store(career_goal, weeks, hours_per_day, items):
+    key = cache_key(career_goal, weeks, hours_per_day)
+
+    def write(conn):
+        conn.execute('''INSERT INTO generation_cache (career_goal, weeks, hours_per_day, created_at, payload)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (career_goal, weeks, hours_per_day) DO UPDATE SET
+                            created_at = excluded.created_at, payload = excluded.payload''',
+                     key + (int(time.time()), compress_items(items)))
+
+    run_write(write)
@@ -0,0 +1,167 @@
+import hashlib
+import json
+
+# Curriculum rows no longer carry their own copy of the topic text and
+# subtopics. The text lives once in shared_plan_items (keyed by a content
+# hash) and each curriculum row only keeps a reference plus a compact
+# per-user progress overlay: one '0'/'1' character per subtopic.
+#
+# Shared items are immutable. When a user's plan diverges (a regenerate
+# produces different content) the new content hashes to a new shared item,
+# so nobody else's plan is ever touched.
+
+CURRICULUM_SELECT = '''
+    SELECT c.id, c.user_id,
+           COALESCE(p.topic, c.topic) AS topic,
+           c.status, c.difficulty_level, c.estimated_hours, c.week_number,
+           COALESCE(p.subtopics, c.subtopics) AS subtopics,
+           c.plan_item_id, c.progress
+    FROM curriculum c
+    LEFT JOIN shared_plan_items p ON p.id = c.plan_item_id
+'''
+
+
+def subtopic_title(subtopic):
+    return subtopic['title'] if isinstance(subtopic, dict) else subtopic
+
+
+def content_hash(topic, titles):
+    """Stable hash of the user-independent content of a curriculum item"""
+    payload = json.dumps([topic, titles], separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def get_or_create_plan_item(conn, topic, titles):
+    """Return the id of the shared item holding this content, inserting it if new.
+
+    The INSERT comes first so the lookup runs inside the caller's write
+    transaction: concurrent writers of the same content never collide on
+    the unique hash, and nothing can prune the row before it is referenced.
+    """
+    digest = content_hash(topic, titles)
+    conn.execute('''INSERT INTO shared_plan_items (content_hash, topic, subtopics) VALUES (?, ?, ?)
+                    ON CONFLICT (content_hash) DO NOTHING''',
+                 (digest, topic, json.dumps(titles)))
+    return conn.execute('SELECT id FROM shared_plan_items WHERE content_hash = ?', (digest,)).fetchone()[0]
+
+
+def progress_from_subtopics(subtopics):
+    return ''.join('1' if isinstance(st, dict) and st.get('completed') else '0' for st in subtopics)
+
+
+def insert_item(conn, user_id, topic, difficulty, estimated_hours, week_number, subtopics, status='pending'):
+    """Store one curriculum item as a reference to shared content. Returns the new row id."""
+    titles = [subtopic_title(st) for st in subtopics]
+    plan_item_id = get_or_create_plan_item(conn, topic, titles)
+    cur = conn.execute('''INSERT INTO curriculum (user_id, topic, status, difficulty_level, estimated_hours, week_number, subtopics, plan_item_id, progress,
+                                                  branch, career_goal)
+                          SELECT ?, '', ?, ?, ?, ?, NULL, ?, ?, branch, career_goal
+                          FROM (SELECT NULL) LEFT JOIN users ON users.id = ?''',
+                       (user_id, status, difficulty, estimated_hours, week_number, plan_item_id,
+                        progress_from_subtopics(subtopics), user_id))
+    return cur.lastrowid
+
+
+SYNC_PROFILE_SQL = '''UPDATE curriculum SET (branch, career_goal) = (SELECT branch, career_goal FROM users WHERE users.id = curriculum.user_id)'''
+
+
+def sync_profile_columns(conn, user_id):
+    """Refresh the branch / career_goal copies on one user's curriculum rows. The caller commits."""
+    return conn.execute(SYNC_PROFILE_SQL + ' WHERE user_id = ?', (user_id,)).rowcount
+
+
+def sync_all_profile_columns(conn):
+    """Refresh the branch / career_goal copies on every curriculum row in the file (migrations only). The caller commits."""
+    return conn.execute(SYNC_PROFILE_SQL).rowcount
+
+
+def insert_plan(conn, user_id, topics_list):
+    """Store a generated plan for a user as references to shared items.
+
+    topics_list is the (topic, difficulty, hours, week, subtopics) tuple list
+    produced by generate_personalized_curriculum. The caller commits.
+    """
+    for topic, difficulty, estimated_hours, week_number, subtopics in topics_list:
+        insert_item(conn, user_id, topic, difficulty, estimated_hours, week_number, subtopics)
+
+
+def row_to_item(row):
+    """Merge a CURRICULUM_SELECT row with its progress overlay into the API shape"""
+    item = dict(row)
+    plan_item_id = item.pop('plan_item_id', None)
+    progress = item.pop('progress', None) or ''
+    try:
+        subtopics = json.loads(item['subtopics']) if item.get('subtopics') else []
+    except (ValueError, TypeError):
+        subtopics = []
+
+    if plan_item_id is not None:
+        # Shared content holds bare titles; completion comes from the overlay
+        subtopics = [{'title': title, 'completed': progress[i:i + 1] == '1'}
+                     for i, title in enumerate(subtopics)]
+    item['subtopics'] = subtopics
+    return item
+
+
+def fetch_curriculum(conn, user_id):
+    rows = conn.execute(CURRICULUM_SELECT + ' WHERE c.user_id = ? ORDER BY c.id', (user_id,)).fetchall()
+    return [row_to_item(row) for row in rows]
+
+
+def fetch_items(conn, user_id, curriculum_ids):
+    """The given items that belong to user_id, keyed by id"""
+    placeholders = ','.join('?' * len(curriculum_ids))
+    rows = conn.execute(CURRICULUM_SELECT + f' WHERE c.user_id = ? AND c.id IN ({placeholders})',
+                        [user_id] + list(curriculum_ids)).fetchall()
+    return {row['id']: row_to_item(row) for row in rows}
+
+
+def fetch_item(conn, curriculum_id):
+    row = conn.execute(CURRICULUM_SELECT + ' WHERE c.id = ?', (curriculum_id,)).fetchone()
+    return row_to_item(row) if row else None
+
+
+def save_subtopics(conn, curriculum_id, subtopics):
+    """Persist subtopic completion for an item, whichever storage it uses"""
+    row = conn.execute('SELECT plan_item_id FROM curriculum WHERE id = ?', (curriculum_id,)).fetchone()
+    if row and row['plan_item_id'] is not None:
+        conn.execute('UPDATE curriculum SET progress = ? WHERE id = ?',
+                     (progress_from_subtopics(subtopics), curriculum_id))
+    else:
+        conn.execute('UPDATE curriculum SET subtopics = ? WHERE id = ?', (json.dumps(subtopics), curriculum_id))
+
+
+def prune_unreferenced_items(conn):
+    """Delete shared items no curriculum row points at any more. Returns rows deleted."""
+    cur = conn.execute('''DELETE FROM shared_plan_items
+                          WHERE id NOT IN (SELECT plan_item_id FROM curriculum WHERE plan_item_id IS NOT NULL)''')
+    return cur.rowcount
+
+
+def save_progress(conn, curriculum_id, status, subtopics):
+    """Write an item's status and subtopic completion in a single UPDATE"""
+    conn.execute('''UPDATE curriculum
+                    SET status = ?,
+                        progress = CASE WHEN plan_item_id IS NOT NULL THEN ? ELSE progress END,
+                        subtopics = CASE WHEN plan_item_id IS NULL THEN ? ELSE subtopics END
+                    WHERE id = ?''',
+                 (status, progress_from_subtopics(subtopics), json.dumps(subtopics), curriculum_id))
+
+
+def dedupe_existing_rows(conn):
+    """Move legacy full-copy curriculum rows onto shared items. Returns rows converted."""
+    rows = conn.execute('SELECT id, topic, subtopics FROM curriculum WHERE plan_item_id IS NULL').fetchall()
+    converted = 0
+    for row in rows:
+        try:
+            subtopics = json.loads(row['subtopics']) if row['subtopics'] else []
+        except (ValueError, TypeError):
+            continue
+        if not isinstance(subtopics, list):
+            continue
+        titles = [subtopic_title(st) for st in subtopics]
+        plan_item_id = get_or_create_plan_item(conn, row['topic'], titles)
+        conn.execute("UPDATE curriculum SET topic = '', subtopics = NULL, plan_item_id = ?, progress = ? WHERE id = ?",
+                     (plan_item_id, progress_from_subtopics(subtopics), row['id']))
+        converted += 1
+    return converted
@@ -0,0 +1,253 @@
+import threading
+import time
+from database import get_db_connection, iter_shard_connections, shard_keys
+from plan_store import fetch_items, save_progress
+from write_queue import run_write_to
+
+# Every status / subtopic transition is appended to progress_events. A
+# rollup job folds new events into hourly and daily buckets in
+# progress_rollups so trend charts never rescan the event log.
+#
+# Rollup rows are kept per user and also under user_id 0, which aggregates
+# all users, so cohort-wide charts read a handful of rows per bucket.
+#
+# Completion rates need a denominator: active_users counts the distinct
+# users with any event in a bucket. Distinct counts do not add up across
+# branches or difficulties, so they are also kept in marker rows whose
+# branch and/or difficulty is ANY ('*'); those rows carry no other counters.
+
+BUCKET_SECONDS = {'hour': 3600, 'day': 86400}
+ALL_USERS = 0
+ANY = '*'
+ROLLUP_BATCH_SIZE = 5000
+
+# Topic statuses the app writes
+STATUSES = ('pending', 'completed')
+
+
+def record_event(conn, user_id, curriculum_id, difficulty_level, old_value, new_value, subtopic_index=None):
+    """Append one transition to the event log. No-op if nothing changed; the caller commits."""
+    if old_value == new_value:
+        return
+    # Branch is captured now so later profile edits do not move old events
+    conn.execute('''INSERT INTO progress_events (created_at, user_id, curriculum_id, difficulty_level, subtopic_index, old_value, new_value, branch)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, (SELECT branch FROM users WHERE id = ?))''',
+                 (int(time.time()), user_id, curriculum_id, difficulty_level, subtopic_index, old_value, new_value, user_id))
+
+
+def subtopic_value(completed):
+    return 'completed' if completed else 'pending'
+
+
+def apply_changes(conn, user_id, changes):
+    """Apply status / subtopic changes to a user's items and log the transitions.
+
+    changes are dicts with an int curriculum_id and either a status or a
+    subtopic_index (plus completed). Everything is applied in memory, in
+    order, before anything is written, so invalid input writes nothing.
+    Returns (body, http status); the caller commits.
+    """
+    # One read for every item touched; ids the user does not own come back missing
+    curriculum_ids = {change['curriculum_id'] for change in changes}
+    items = fetch_items(conn, user_id, curriculum_ids)
+    missing = [cid for cid in curriculum_ids if cid not in items]
+    if missing:
+        return {'error': 'Item not found', 'curriculum_ids': missing}, 404
+
+    original_status = {cid: item['status'] for cid, item in items.items()}
+    original_completed = {}
+    subtopics_changed = set()
+
+    for change in changes:
+        item = items[change['curriculum_id']]
+        if 'subtopic_index' in change:
+            index = change['subtopic_index']
+            subtopics = item['subtopics']
+            if isinstance(index, bool) or not isinstance(index, int) or not 0 <= index < len(subtopics):
+                return {'error': 'Invalid subtopic index', 'curriculum_id': item['id']}, 400
+            if isinstance(subtopics[index], str):
+                subtopics[index] = {'title': subtopics[index], 'completed': False}
+            original_completed.setdefault((item['id'], index), subtopics[index].get('completed', False))
+            subtopics[index]['completed'] = bool(change.get('completed'))
+            subtopics_changed.add(item['id'])
+        elif 'status' in change:
+            if change['status'] not in STATUSES:
+                return {'error': f"status must be one of {', '.join(STATUSES)}", 'curriculum_id': item['id']}, 400
+            item['status'] = change['status']
+        else:
+            return {'error': 'Each change needs a status or a subtopic_index', 'curriculum_id': item['id']}, 400
+
+    # Finishing the last subtopic auto-completes the parent, as /update-subtopic
+    # does; checked once per item, after all of its changes
+    for cid in subtopics_changed:
+        if all(isinstance(st, dict) and st.get('completed', False) for st in items[cid]['subtopics']):
+            items[cid]['status'] = 'completed'
+
+    for cid, item in items.items():
+        subtopics = item['subtopics']
+        save_progress(conn, cid, item['status'], subtopics)
+        for (item_id, index), was_completed in original_completed.items():
+            if item_id == cid:
+                record_event(conn, user_id, cid, item['difficulty_level'],
+                             subtopic_value(was_completed), subtopic_value(subtopics[index]['completed']), index)
+        record_event(conn, user_id, cid, item['difficulty_level'], original_status[cid], item['status'])
+
+    return {'message': 'Batch applied', 'items': list(items.values())}, 200
+
+
+def _counters(event):
+    """Map an event to (topics_completed, topics_reopened, subtopics_completed, subtopics_reopened)"""
+    completed = 1 if event['new_value'] == 'completed' else 0
+    reopened = 1 if event['old_value'] == 'completed' and not completed else 0
+    if event['subtopic_index'] is None:
+        return (completed, reopened, 0, 0)
+    return (0, 0, completed, reopened)
+
+
+def run_rollup(conn, batch_size=ROLLUP_BATCH_SIZE):
+    """Fold events past the stored watermark into progress_rollups. Returns events processed; the caller commits."""
+    row = conn.execute("SELECT last_event_id FROM rollup_state WHERE name = 'progress'").fetchone()
+    last_event_id = row[0] if row else 0
+
+    # Events logged before branch was recorded fall back to the current profile
+    events = conn.execute('''SELECT e.id, e.created_at, e.user_id, e.difficulty_level, e.subtopic_index,
+                                    e.old_value, e.new_value, COALESCE(e.branch, u.branch, '') AS branch
+                             FROM progress_events e
+                             LEFT JOIN users u ON u.id = e.user_id
+                             WHERE e.id > ?
+                             ORDER BY e.id
+                             LIMIT ?''', (last_event_id, batch_size)).fetchall()
+    if not events:
+        return 0
+
+    totals = {}
+    seen = set()
+
+    def add(key, counts):
+        current = totals.get(key, (0, 0, 0, 0, 0))
+        totals[key] = tuple(a + b for a, b in zip(current, counts))
+
+    for event in events:
+        counters = _counters(event) + (0,)
+        difficulty = event['difficulty_level'] or ''
+        for bucket, size in BUCKET_SECONDS.items():
+            bucket_start = event['created_at'] - event['created_at'] % size
+            for user_id in (event['user_id'], ALL_USERS):
+                add((bucket, bucket_start, user_id, event['branch'], difficulty), counters)
+
+            # The user's first event in this bucket for a branch/difficulty
+            # slice makes them active there, for themselves and for everyone
+            for branch, level in ((event['branch'], difficulty), (event['branch'], ANY), (ANY, difficulty), (ANY, ANY)):
+                user_key = (bucket, bucket_start, event['user_id'], branch, level)
+                if user_key in seen:
+                    continue
+                seen.add(user_key)
+                if user_key in totals and totals[user_key][4] or conn.execute(
+                        '''SELECT 1 FROM progress_rollups WHERE bucket = ? AND bucket_start = ? AND user_id = ?
+                           AND branch = ? AND difficulty_level = ? AND active_users > 0''', user_key).fetchone():
+                    continue
+                add(user_key, (0, 0, 0, 0, 1))
+                add((bucket, bucket_start, ALL_USERS, branch, level), (0, 0, 0, 0, 1))
+
+    conn.executemany('''INSERT INTO progress_rollups (bucket, bucket_start, user_id, branch, difficulty_level,
+                                                      topics_completed, topics_reopened, subtopics_completed, subtopics_reopened,
+                                                      active_users)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                        ON CONFLICT (bucket, bucket_start, user_id, branch, difficulty_level) DO UPDATE SET
+                            topics_completed = topics_completed + excluded.topics_completed,
+                            topics_reopened = topics_reopened + excluded.topics_reopened,
+                            subtopics_completed = subtopics_completed + excluded.subtopics_completed,
+                            subtopics_reopened = subtopics_reopened + excluded.subtopics_reopened,
+                            active_users = active_users + excluded.active_users''',
+                     [key + counts for key, counts in totals.items()])
+    conn.execute('''INSERT INTO rollup_state (name, last_event_id) VALUES ('progress', ?)
+                    ON CONFLICT (name) DO UPDATE SET last_event_id = excluded.last_event_id''',
+                 (events[-1]['id'],))
+    return len(events)
+
+
+def completion_trend(conn, bucket='day', user_id=None, branch=None, difficulty=None, since=None, until=None):
+    """Completion counts and active users per time bucket, read straight from the rollups"""
+    counted = f"branch != '{ANY}' AND difficulty_level != '{ANY}'"
+    query = f'''SELECT bucket_start,
+                       SUM(CASE WHEN {counted} THEN topics_completed ELSE 0 END) AS topics_completed,
+                       SUM(CASE WHEN {counted} THEN topics_reopened ELSE 0 END) AS topics_reopened,
+                       SUM(CASE WHEN {counted} THEN subtopics_completed ELSE 0 END) AS subtopics_completed,
+                       SUM(CASE WHEN {counted} THEN subtopics_reopened ELSE 0 END) AS subtopics_reopened,
+                       SUM(CASE WHEN branch = ? AND difficulty_level = ? THEN active_users ELSE 0 END) AS active_users
+                FROM progress_rollups
+                WHERE bucket = ? AND user_id = ?'''
+    params = [branch if branch is not None else ANY, difficulty if difficulty is not None else ANY,
+              bucket, user_id if user_id is not None else ALL_USERS]
+    if branch is not None:
+        query += ' AND branch = ?'
+        params.append(branch)
+    if difficulty is not None:
+        query += ' AND difficulty_level = ?'
+        params.append(difficulty)
+    if since is not None:
+        query += ' AND bucket_start >= ?'
+        params.append(since)
+    if until is not None:
+        query += ' AND bucket_start < ?'
+        params.append(until)
+    query += ' GROUP BY bucket_start ORDER BY bucket_start'
+    return [dict(row) for row in conn.execute(query, params).fetchall()]
+
+
+def with_completion_rates(points):
+    """Add completions per active user to each point (None for buckets rolled up before users were counted)"""
+    for point in points:
+        active = point['active_users']
+        point['topics_completed_per_active_user'] = point['topics_completed'] / active if active else None
+        point['subtopics_completed_per_active_user'] = point['subtopics_completed'] / active if active else None
+    return points
+
+
+def completion_trend_all_shards(bucket='day', user_id=None, **filters):
+    """completion_trend for one user's shard, or summed over every shard"""
+    if user_id is not None:
+        conn = get_db_connection(user_id)
+        points = completion_trend(conn, bucket=bucket, user_id=user_id, **filters)
+        conn.close()
+        return with_completion_rates(points)
+
+    # Each user lives in exactly one shard, so active user counts add up too
+    merged = {}
+    for conn in iter_shard_connections():
+        for point in completion_trend(conn, bucket=bucket, **filters):
+            current = merged.setdefault(point['bucket_start'], dict.fromkeys(point, 0))
+            for key, value in point.items():
+                current[key] = value if key == 'bucket_start' else current[key] + value
+    return with_completion_rates([merged[bucket_start] for bucket_start in sorted(merged)])
+
+
+def rollup_until_caught_up():
+    processed = 0
+    for key in shard_keys():
+        while True:
+            # Through the writer like every other mutation, one batch per transaction
+            batch = run_write_to(key, run_rollup)
+            processed += batch
+            if batch < ROLLUP_BATCH_SIZE:
+                break
+    return processed
+
+
+def start_rollup_worker(interval_seconds):
+    """Run the rollup job periodically on a daemon thread"""
+    def loop():
+        while True:
+            try:
+                rollup_until_caught_up()
+            except Exception as e:
+                print(f"Rollup error: {e}")
+            time.sleep(interval_seconds)
+
+    worker = threading.Thread(target=loop, name='progress-rollup', daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == '__main__':
+    print(f"Rolled up {rollup_until_caught_up()} progress events.")
@@ -0,0 +1,261 @@
+import math
+import re
+import unicodedata
+from database import backend, shard_key, shard_keys
+
+# Ranked full-text search over topic and subtopic titles using the FTS5
+# tables maintained by triggers (see database._create_search_index).
+#
+# bm25() scores from different FTS tables or shard files use different
+# corpus statistics and cannot be compared, so candidates are re-scored
+# here with one BM25 over the statistics of every searched table. Cohort
+# searches rank distinct documents (a shared plan item is one document no
+# matter how many users have it) and only then expand the best ones to the
+# curriculum rows that reference them, stopping once the page is full.
+
+MAX_PAGE_SIZE = 100
+# Best documents per table and shard considered for a cohort search
+SEARCH_CANDIDATES = 200
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+FTS_TABLES = ('shared_plan_items_fts', 'curriculum_fts')
+
+SNIPPET = "snippet({table}, -1, '[', ']', '...', 10)"
+
+# Only documents with at least one curriculum row in the cohort are
+# candidates, so every candidate expands to one row or more
+CANDIDATES_SQL = '''
+    SELECT rowid AS id, topic, subtopics
+    FROM {table}
+    WHERE {table} MATCH :query
+      AND EXISTS (SELECT 1 FROM curriculum c WHERE {match_column} = {table}.rowid {filters})
+    ORDER BY rank, rowid
+    LIMIT :limit
+'''
+
+# Snippets are only built for the documents that make it onto the page
+SNIPPET_SQL = '''
+    SELECT {snippet} FROM {table}
+    WHERE {table} MATCH :query AND rowid = :id
+'''
+
+USER_SQL = '''
+    SELECT c.id AS curriculum_id, c.user_id, c.week_number, c.status, c.difficulty_level,
+           f.topic, f.subtopics, {snippet} AS snippet
+    FROM curriculum c CROSS JOIN {table} f ON f.rowid = {join_column}
+    WHERE {table} MATCH :query AND c.user_id = :user_id
+'''
+
+# Rows referencing one document, optionally restricted to a cohort through
+# the branch / career_goal copies indexed together with plan_item_id.
+EXPAND_SQL = '''
+    SELECT c.id AS curriculum_id, c.user_id, c.week_number, c.status, c.difficulty_level
+    FROM curriculum c
+    WHERE {match_column} = :id {filters}
+    ORDER BY c.id
+    LIMIT :limit
+'''
+
+
+def tokenize(text):
+    """Lowercased words without diacritics, split like the FTS5 unicode61 tokenizer"""
+    folded = text.lower()
+    if not folded.isascii():
+        folded = ''.join(ch for ch in unicodedata.normalize('NFKD', folded) if not unicodedata.combining(ch))
+    return re.findall(r'[^\W_]+', folded)
+
+
+def to_match_expression(terms):
+    """FTS5 query requiring every term, the last one as a prefix"""
+    quoted = ['"' + term + '"' for term in terms]
+    if quoted:
+        quoted[-1] += '*'
+    return ' '.join(quoted)
+
+
+def _read_varint(buf, pos):
+    """SQLite varint (big-endian, 7 bits per byte, 9th byte full) at pos; returns (value, next pos)"""
+    value = 0
+    for i in range(8):
+        byte = buf[pos + i]
+        value = (value << 7) | (byte & 0x7f)
+        if byte < 0x80:
+            return value, pos + i + 1
+    return (value << 8) | buf[pos + 8], pos + 9
+
+
+def fts_totals(conn, table):
+    """(rows, tokens) of an FTS5 table, as its own bm25() sees them.
+
+    FTS5 keeps these in the averages record of its shadow table
+    ({table}_data, id 1): the row count followed by one token count per
+    column, all varints. The format is internal to FTS5, so
+    tests/test_search.py checks the decoded values and the scores built
+    on them against bm25() whenever SQLite changes.
+    """
+    row = conn.execute(f'SELECT block FROM {table}_data WHERE id = 1').fetchone()
+    if not row or not row[0]:
+        return 0, 0
+    block = row[0]
+    rows, pos = _read_varint(block, 0)
+    tokens = 0
+    while pos < len(block):
+        column_tokens, pos = _read_varint(block, pos)
+        tokens += column_tokens
+    return rows, tokens
+
+
+def _document_frequency(conn, table, term, prefix):
+    if prefix:
+        # Documents holding several words with the prefix count more than once;
+        # the caller caps the result at the row count
+        row = conn.execute(f'SELECT SUM(doc) FROM {table}_terms WHERE term >= ? AND term < ?',
+                           (term, term[:-1] + chr(ord(term[-1]) + 1))).fetchone()
+    else:
+        row = conn.execute(f'SELECT doc FROM {table}_terms WHERE term = ?', (term,)).fetchone()
+    return (row[0] or 0) if row else 0
+
+
+class Scorer:
+    """BM25 over the combined statistics of several FTS tables"""
+
+    def __init__(self, terms):
+        self.terms = terms
+        self.rows = 0
+        self.tokens = 0
+        self.frequencies = [0] * len(terms)
+
+    def add_table(self, conn, table):
+        rows, tokens = fts_totals(conn, table)
+        self.rows += rows
+        self.tokens += tokens
+        for i, term in enumerate(self.terms):
+            self.frequencies[i] += _document_frequency(conn, table, term, i == len(self.terms) - 1)
+
+    def score(self, document):
+        words = tokenize(document['topic'] or '') + tokenize(document['subtopics'] or '')
+        average_length = self.tokens / self.rows if self.rows else 1
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * len(words) / average_length)
+        score = 0.0
+        for i, term in enumerate(self.terms):
+            if i == len(self.terms) - 1:
+                frequency = sum(1 for word in words if word.startswith(term))
+            else:
+                frequency = words.count(term)
+            documents = min(self.frequencies[i], self.rows)
+            idf = max(math.log((self.rows - documents + 0.5) / (documents + 0.5)), 1e-6)
+            score += idf * frequency * (BM25_K1 + 1) / (frequency + norm)
+        return score
+
+
+def _result(row, document, score):
+    return {
+        'curriculum_id': row['curriculum_id'],
+        'user_id': row['user_id'],
+        'topic': document['topic'],
+        'week_number': row['week_number'],
+        'status': row['status'],
+        'difficulty_level': row['difficulty_level'],
+        'snippet': document['snippet'],
+        'score': round(score, 4),
+    }
+
+
+def _search_user(conn, scorer, match, user_id):
+    results = []
+    for table, join_column in zip(FTS_TABLES, ('c.plan_item_id', 'c.id')):
+        sql = USER_SQL.format(table=table, join_column=join_column, snippet=SNIPPET.format(table=table))
+        for row in conn.execute(sql, {'query': match, 'user_id': user_id}):
+            results.append(_result(row, row, scorer.score(row)))
+    results.sort(key=lambda result: (-result['score'], result['curriculum_id']))
+    return results
+
+
+def _cohort_documents(connections, scorer, match, candidates, filters, params):
+    """Best matching distinct documents in the cohort over every shard, best first.
+
+    Shared items are grouped by content, so the same plan item stored in
+    several shards is one document with several locations.
+    """
+    documents = {}
+    for source, (key, conn) in enumerate(connections.items()):
+        for table, match_column in zip(FTS_TABLES, ('c.plan_item_id', 'c.id')):
+            sql = CANDIDATES_SQL.format(table=table, match_column=match_column, filters=filters)
+            for position, row in enumerate(conn.execute(sql, dict(params, query=match, limit=candidates))):
+                if table == 'shared_plan_items_fts':
+                    identity = (row['topic'], row['subtopics'])
+                else:
+                    identity = (key, row['id'])
+                document = documents.get(identity)
+                if document is None:
+                    # Ties keep each source's own order, so a larger candidate
+                    # set (a later page) extends the order of a smaller one
+                    document = dict(row, snippet=None, locations=[], order=(position, source, table))
+                    documents[identity] = document
+                document['locations'].append((key, table, match_column, row['id']))
+
+    ranked = [(scorer.score(document), document) for document in documents.values()]
+    ranked.sort(key=lambda entry: (-entry[0], entry[1]['order']))
+    return ranked
+
+
+def _search_cohort(connections, scorer, match, limit, offset, branch=None, career_goal=None):
+    filters = ''
+    params = {}
+    if branch is not None:
+        filters += ' AND c.branch = :branch'
+        params['branch'] = branch
+    if career_goal is not None:
+        filters += ' AND c.career_goal = :career_goal'
+        params['career_goal'] = career_goal
+
+    # Each candidate yields at least one row, so offset + limit documents per
+    # source always fill the page when there are that many matches
+    candidates = max(SEARCH_CANDIDATES, offset + limit)
+    results = []
+    skip = offset
+    for score, document in _cohort_documents(connections, scorer, match, candidates, filters, params):
+        for key, table, match_column, document_id in document['locations']:
+            wanted = skip + limit - len(results)
+            sql = EXPAND_SQL.format(match_column=match_column, filters=filters)
+            rows = connections[key].execute(sql, dict(params, id=document_id, limit=wanted)).fetchall()
+            if len(rows) <= skip:
+                skip -= len(rows)
+                continue
+            if document['snippet'] is None:
+                sql = SNIPPET_SQL.format(table=table, snippet=SNIPPET.format(table=table))
+                document['snippet'] = connections[key].execute(sql, {'query': match, 'id': document_id}).fetchone()[0]
+            results.extend(_result(row, document, score) for row in rows[skip:])
+            skip = 0
+            if len(results) >= limit:
+                return results
+    return results
+
+
+def search_curriculum(text, user_id=None, branch=None, career_goal=None, limit=20, offset=0):
+    """Best-scored curriculum items matching text, for one user or a cohort (branch / career goal)"""
+    terms = tokenize(text)
+    if not terms:
+        return []
+    match = to_match_expression(terms)
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    offset = max(0, int(offset))
+
+    keys = shard_keys() if user_id is None else [shard_key(user_id=user_id)]
+    connections = {key: backend.connect(key) for key in keys}
+    try:
+        # One set of statistics for every table and shard searched keeps scores comparable
+        scorer = Scorer(terms)
+        for conn in connections.values():
+            for table in FTS_TABLES:
+                scorer.add_table(conn, table)
+
+        if user_id is not None:
+            results = _search_user(connections[keys[0]], scorer, match, user_id)
+            return results[offset:offset + limit]
+        return _search_cohort(connections, scorer, match, limit, offset, branch, career_goal)
+    finally:
+        for conn in connections.values():
+            conn.close()
@@ -0,0 +1,178 @@
+import argparse
+import glob
+import os
+import sqlite3
+from database import DB_NAME, DB_SHARDS, make_backend, init_shard_file
+from plan_store import prune_unreferenced_items
+from progress_log import run_rollup, ROLLUP_BATCH_SIZE
+
+# Moves per-user rows (curriculum, snapshots, progress events, per-user rollups) into
+# the shard each user hashes to under a given shard count. Run it with the
+# app stopped, then restart the app with DB_SHARDS set to the same count.
+
+
+def candidate_files(db_path=DB_NAME):
+    """The directory file plus every shard file present on disk"""
+    base, ext = os.path.splitext(db_path)
+    paths = [db_path] + sorted(glob.glob(f"{base}.shard*{ext}"))
+    return [path for path in paths if os.path.exists(path)]
+
+
+def open_file(path, db_path=DB_NAME):
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    if os.path.abspath(path) != os.path.abspath(db_path):
+        # Rollups join events with users, which live in the directory file
+        conn.execute('ATTACH DATABASE ? AS directory', (db_path,))
+    return conn
+
+
+def has_user_tables(conn):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'curriculum'").fetchone() is not None
+
+
+def catch_up_rollups(path, db_path=DB_NAME):
+    """Roll up outstanding events so moved events are never counted twice"""
+    conn = open_file(path, db_path)
+    if has_user_tables(conn):
+        while run_rollup(conn) == ROLLUP_BATCH_SIZE:
+            conn.commit()
+        conn.commit()
+    conn.close()
+
+
+def merge_rollups(conn, where, params=()):
+    """Add main's matching rollup rows into dst and delete them from main"""
+    conn.execute(f'''INSERT INTO dst.progress_rollups
+                     SELECT * FROM main.progress_rollups WHERE {where}
+                     ON CONFLICT (bucket, bucket_start, user_id, branch, difficulty_level) DO UPDATE SET
+                         topics_completed = topics_completed + excluded.topics_completed,
+                         topics_reopened = topics_reopened + excluded.topics_reopened,
+                         subtopics_completed = subtopics_completed + excluded.subtopics_completed,
+                         subtopics_reopened = subtopics_reopened + excluded.subtopics_reopened,
+                         active_users = active_users + excluded.active_users''', params)
+    conn.execute(f'DELETE FROM main.progress_rollups WHERE {where}', params)
+
+
+def move_user(conn, user_id):
+    """Copy one user's rows from main into the attached dst database and delete them from main"""
+    conn.execute('''INSERT OR IGNORE INTO dst.shared_plan_items (content_hash, topic, subtopics)
+                    SELECT content_hash, topic, subtopics FROM main.shared_plan_items
+                    WHERE id IN (SELECT plan_item_id FROM main.curriculum WHERE user_id = ?)''', (user_id,))
+
+    new_ids = {}
+    rows = conn.execute('''SELECT c.*, p.content_hash FROM main.curriculum c
+                           LEFT JOIN main.shared_plan_items p ON p.id = c.plan_item_id
+                           WHERE c.user_id = ? ORDER BY c.id''', (user_id,)).fetchall()
+    for row in rows:
+        plan_item_id = None
+        if row['content_hash'] is not None:
+            plan_item_id = conn.execute('SELECT id FROM dst.shared_plan_items WHERE content_hash = ?',
+                                        (row['content_hash'],)).fetchone()[0]
+        cur = conn.execute('''INSERT INTO dst.curriculum (user_id, topic, status, difficulty_level, estimated_hours, week_number, subtopics, plan_item_id, progress,
+                                                         branch, career_goal)
+                              VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)''',
+                           (user_id, row['topic'], row['status'], row['difficulty_level'], row['estimated_hours'],
+                            row['week_number'], row['subtopics'], plan_item_id, row['progress'], row['branch'], row['career_goal']))
+        new_ids[row['id']] = cur.lastrowid
+
+    events = conn.execute('SELECT * FROM main.progress_events WHERE user_id = ? ORDER BY id', (user_id,)).fetchall()
+    conn.executemany('''INSERT INTO dst.progress_events (created_at, user_id, curriculum_id, difficulty_level, subtopic_index, old_value, new_value, branch)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
+                     [(e['created_at'], user_id, new_ids.get(e['curriculum_id'], e['curriculum_id']), e['difficulty_level'],
+                       e['subtopic_index'], e['old_value'], e['new_value'], e['branch']) for e in events])
+
+    # Per-user rollups move with the user. The all-users rows stay behind;
+    # trend queries sum them over every shard anyway.
+    merge_rollups(conn, 'user_id = ?', (user_id,))
+    # Moved events are already reflected in the rollups; skip them in dst
+    conn.execute('''INSERT INTO dst.rollup_state (name, last_event_id)
+                    SELECT 'progress', COALESCE(MAX(id), 0) FROM dst.progress_events WHERE true
+                    ON CONFLICT (name) DO UPDATE SET last_event_id = excluded.last_event_id''')
+
+    conn.execute('''INSERT INTO dst.curriculum_snapshots (user_id, version, created_at, item_count, payload)
+                    SELECT user_id, version, created_at, item_count, payload FROM main.curriculum_snapshots
+                    WHERE user_id = ?''', (user_id,))
+
+    conn.execute('DELETE FROM main.curriculum WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM main.curriculum_snapshots WHERE user_id = ?', (user_id,))
+    conn.execute('DELETE FROM main.progress_events WHERE user_id = ?', (user_id,))
+    return len(rows)
+
+
+def rebalance(shard_count, db_path=DB_NAME):
+    target = make_backend(shard_count, db_path)
+    for shard, path in enumerate(target.shard_paths()):
+        init_shard_file(path, shard)
+
+    sources = candidate_files(db_path)
+    target_paths = {os.path.abspath(path) for path in target.shard_paths()}
+    for path in sources:
+        catch_up_rollups(path, db_path)
+
+    moved_users = 0
+    moved_rows = 0
+    for path in sources:
+        conn = open_file(path, db_path)
+        if not has_user_tables(conn):
+            conn.close()
+            continue
+
+        user_ids = [row[0] for row in conn.execute(
+            '''SELECT user_id FROM curriculum UNION SELECT user_id FROM curriculum_snapshots
+               UNION SELECT user_id FROM progress_events''')]
+        attached = None
+        for user_id in user_ids:
+            if user_id is None:
+                continue
+            dst_path = target.shard_path(target.shard_for_user(user_id))
+            if os.path.abspath(dst_path) == os.path.abspath(path):
+                continue
+            if attached != dst_path:
+                if attached is not None:
+                    conn.execute('DETACH DATABASE dst')
+                conn.execute('ATTACH DATABASE ? AS dst', (dst_path,))
+                attached = dst_path
+            moved_rows += move_user(conn, user_id)
+            conn.commit()
+            moved_users += 1
+        if attached is not None:
+            conn.execute('DETACH DATABASE dst')
+
+        # A file dropping out of the shard set hands its all-users rollups to shard 0
+        if os.path.abspath(path) not in target_paths:
+            conn.execute('ATTACH DATABASE ? AS dst', (target.shard_path(0),))
+            merge_rollups(conn, 'user_id = 0')
+            conn.commit()
+            conn.execute('DETACH DATABASE dst')
+
+        # Drop shared items no longer referenced from this file
+        prune_unreferenced_items(conn)
+        conn.commit()
+        conn.close()
+        print(f"{path}: rebalanced")
+
+    print(f"Moved {moved_rows} curriculum rows for {moved_users} users into {shard_count} shard(s).")
+
+
+def status(db_path=DB_NAME):
+    for path in candidate_files(db_path):
+        conn = sqlite3.connect(path)
+        if has_user_tables(conn):
+            users, rows = conn.execute('SELECT COUNT(DISTINCT user_id), COUNT(*) FROM curriculum').fetchone()
+            print(f"{path}: {users} users, {rows} curriculum rows")
+        conn.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Inspect or rebalance sharded curriculum storage")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('status', help="Show users and rows per database file")
+    rebalance_parser = subparsers.add_parser('rebalance', help="Move every user's rows to its shard")
+    rebalance_parser.add_argument('--shards', type=int, default=DB_SHARDS)
+    args = parser.parse_args()
+
+    if args.command == 'status':
+        status()
+    else:
+        rebalance(args.shards)
@@ -0,0 +1,83 @@
+from database import get_db_connection
+
+# Per-term user counters for the comma-separated profile columns. register()
+# and update_profile() apply the difference between a user's old and new
+# profile, so top-N queries read a small indexed table instead of parsing
+# every row of users.
+
+TERM_KINDS = {
+    'skill': 'skills',
+    'weak_subject': 'weak_subjects',
+    'career_goal': 'career_goal',
+}
+
+
+def parse_terms(value, split=True):
+    """Normalized name -> display name for a profile field"""
+    if not value:
+        return {}
+    parts = value.split(',') if split else [value]
+    terms = {}
+    for part in parts:
+        display = ' '.join(part.split())
+        if display:
+            terms.setdefault(display.lower(), display)
+    return terms
+
+
+def profile_terms(profile):
+    """Set of (kind, name, display_name) a user profile contributes"""
+    terms = set()
+    if not profile:
+        return terms
+    for kind, column in TERM_KINDS.items():
+        for name, display in parse_terms(profile.get(column), split=kind != 'career_goal').items():
+            terms.add((kind, name, display))
+    return terms
+
+
+def apply_profile_change(conn, old_profile, new_profile):
+    """Adjust counters for a user going from old_profile to new_profile. The caller commits."""
+    old_terms = {(kind, name): display for kind, name, display in profile_terms(old_profile)}
+    new_terms = {(kind, name): display for kind, name, display in profile_terms(new_profile)}
+
+    for (kind, name), display in new_terms.items():
+        if (kind, name) not in old_terms:
+            conn.execute('''INSERT INTO profile_terms (kind, name, display_name, user_count) VALUES (?, ?, ?, 1)
+                            ON CONFLICT (kind, name) DO UPDATE SET user_count = user_count + 1''',
+                         (kind, name, display))
+
+    removed = [key for key in old_terms if key not in new_terms]
+    if removed:
+        conn.executemany('UPDATE profile_terms SET user_count = user_count - 1 WHERE kind = ? AND name = ?', removed)
+        conn.execute('DELETE FROM profile_terms WHERE user_count <= 0')
+
+
+def top_terms(conn, kind, limit=10):
+    rows = conn.execute('''SELECT display_name FROM profile_terms
+                           WHERE kind = ? ORDER BY user_count DESC, name LIMIT ?''', (kind, limit)).fetchall()
+    return [row[0] for row in rows]
+
+
+def backfill(conn):
+    """Rebuild all counters from the users table in one pass. Returns distinct terms; the caller commits."""
+    counts = {}
+    for row in conn.execute('SELECT career_goal, skills, weak_subjects FROM users'):
+        for kind, name, display in profile_terms(dict(row)):
+            key = (kind, name)
+            if key in counts:
+                counts[key][1] += 1
+            else:
+                counts[key] = [display, 1]
+
+    conn.execute('DELETE FROM profile_terms')
+    conn.executemany('INSERT INTO profile_terms (kind, name, display_name, user_count) VALUES (?, ?, ?, ?)',
+                     [(kind, name, display, count) for (kind, name), (display, count) in counts.items()])
+    return len(counts)
+
+
+if __name__ == '__main__':
+    conn = get_db_connection()
+    print(f"Backfilled {backfill(conn)} profile terms.")
+    conn.commit()
+    conn.close()
@@ -0,0 +1,146 @@
+import argparse
+import json
+import os
+import threading
+import time
+import zlib
+from database import backend, shard_keys
+from plan_store import fetch_curriculum, insert_item, prune_unreferenced_items
+from write_queue import run_write_to
+
+# Regenerating or restoring a plan archives the current one as a single
+# compressed row in curriculum_snapshots instead of throwing it away. The
+# live curriculum table only ever holds each user's current plan.
+
+# Snapshots kept per user; older ones are dropped on archive and by compact()
+SNAPSHOT_RETENTION = int(os.getenv("SNAPSHOT_RETENTION", "5"))
+
+
+def compress_items(items):
+    return zlib.compress(json.dumps(items, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def decompress_items(payload):
+    return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def apply_retention(conn, user_id, keep=SNAPSHOT_RETENTION):
+    conn.execute('''DELETE FROM curriculum_snapshots
+                    WHERE user_id = ? AND version NOT IN (
+                        SELECT version FROM curriculum_snapshots WHERE user_id = ?
+                        ORDER BY version DESC LIMIT ?)''', (user_id, user_id, keep))
+
+
+def archive_current_plan(conn, user_id):
+    """Snapshot the user's live plan and remove it from curriculum.
+
+    Returns the new snapshot version, or None if there was nothing to
+    archive. The caller commits.
+    """
+    items = fetch_curriculum(conn, user_id)
+    if not items:
+        return None
+
+    row = conn.execute('SELECT MAX(version) FROM curriculum_snapshots WHERE user_id = ?', (user_id,)).fetchone()
+    version = (row[0] or 0) + 1
+    conn.execute('''INSERT INTO curriculum_snapshots (user_id, version, created_at, item_count, payload)
+                    VALUES (?, ?, ?, ?, ?)''',
+                 (user_id, version, int(time.time()), len(items), compress_items(items)))
+    conn.execute('DELETE FROM curriculum WHERE user_id = ?', (user_id,))
+    apply_retention(conn, user_id)
+    return version
+
+
+def list_snapshots(conn, user_id):
+    rows = conn.execute('''SELECT version, created_at, item_count, LENGTH(payload) AS size_bytes
+                           FROM curriculum_snapshots WHERE user_id = ? ORDER BY version DESC''', (user_id,)).fetchall()
+    return [dict(row) for row in rows]
+
+
+def restore_snapshot(conn, user_id, version):
+    """Make a snapshot the live plan again, archiving the current one first.
+
+    Returns False if the snapshot does not exist. The caller commits.
+    """
+    row = conn.execute('SELECT payload FROM curriculum_snapshots WHERE user_id = ? AND version = ?',
+                       (user_id, version)).fetchone()
+    if not row:
+        return False
+
+    archive_current_plan(conn, user_id)
+    for item in decompress_items(row['payload']):
+        insert_item(conn, user_id, item['topic'], item['difficulty_level'], item['estimated_hours'],
+                    item['week_number'], item['subtopics'], item.get('status', 'pending'))
+    return True
+
+
+def release_free_pages(conn):
+    """Truncate free pages off the end of the file inside the current transaction.
+
+    Each step of PRAGMA incremental_vacuum frees one page, but the pragma
+    reports no result columns, so execute() steps it once and fetchall()
+    has nothing to fetch. executemany() re-steps it once per free page in
+    a single call (executescript() would also work but commits first).
+    Returns pages released.
+    """
+    free_pages = conn.execute('PRAGMA freelist_count').fetchone()[0]
+    conn.executemany('PRAGMA incremental_vacuum', [()] * free_pages)
+    return free_pages
+
+
+def compact(keep=SNAPSHOT_RETENTION, vacuum=False):
+    """Enforce retention everywhere, drop unreferenced shared items and release free pages"""
+    def write(conn):
+        cur = conn.execute('''DELETE FROM curriculum_snapshots WHERE id IN (
+                                  SELECT id FROM (
+                                      SELECT id, ROW_NUMBER() OVER (PARTITION BY user_id ORDER BY version DESC) AS rank
+                                      FROM curriculum_snapshots)
+                                  WHERE rank > ?)''', (keep,))
+        removed = (cur.rowcount, prune_unreferenced_items(conn))
+        if not vacuum and conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2:
+            release_free_pages(conn)
+        return removed
+
+    removed_snapshots = 0
+    removed_items = 0
+    for key in shard_keys():
+        # Through the writer, so pruning never interleaves with a plan insert
+        snapshots, items = run_write_to(key, write)
+        removed_snapshots += snapshots
+        removed_items += items
+
+        conn = backend.connect(key)
+        if vacuum:
+            # A full rebuild also switches files created before auto_vacuum was set
+            conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+            conn.execute('VACUUM')
+        elif conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 0:
+            print(f"{backend.shard_path(key)}: auto_vacuum is off, so free pages are not released; "
+                  f"run 'python snapshots.py --vacuum' once to enable it")
+        conn.close()
+    return removed_snapshots, removed_items
+
+
+def start_compaction_worker(interval_seconds):
+    """Run compact() periodically on a daemon thread"""
+    def loop():
+        while True:
+            time.sleep(interval_seconds)
+            try:
+                compact()
+            except Exception as e:
+                print(f"Snapshot compaction error: {e}")
+
+    worker = threading.Thread(target=loop, name='snapshot-compaction', daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compact curriculum snapshot storage")
+    parser.add_argument('--keep', type=int, default=SNAPSHOT_RETENTION, help="Snapshots to keep per user")
+    parser.add_argument('--vacuum', action='store_true', help="Rebuild the files with a full VACUUM")
+    args = parser.parse_args()
+
+    snapshots, items = compact(args.keep, args.vacuum)
+    print(f"Removed {snapshots} snapshots and {items} unreferenced shared plan items.")
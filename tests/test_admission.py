@@ -0,0 +1,32 @@
+import time
+import pytest
+
+pytest.importorskip('google.generativeai')
+from ai_service import AdmissionQueue, AdmissionRejected, TokenBucket, INTERACTIVE, BATCH
+
+
+def run_order(queue, submissions, delay_before_last=0.05):
+    started = []
+    futures = [queue.submit(lambda name=name: started.append(name), priority) for name, priority in submissions[:-1]]
+    time.sleep(delay_before_last)
+    name, priority = submissions[-1]
+    futures.append(queue.submit(lambda: started.append(name), priority))
+    for future in futures:
+        future.result(timeout=10)
+    return started
+
+
+def test_interactive_overtakes_queued_batch_work():
+    queue = AdmissionQueue(TokenBucket(5, 1), 20, 4)
+    order = run_order(queue, [(f"batch{i}", BATCH) for i in range(5)] + [("interactive", INTERACTIVE)])
+    assert order.index("interactive") == 1
+    assert [name for name in order if name != "interactive"] == [f"batch{i}" for i in range(5)]
+
+
+def test_batch_work_is_limited_to_half_the_queue():
+    queue = AdmissionQueue(TokenBucket(0.1, 1), 4, 1)
+    queue.submit(lambda: time.sleep(0.2), BATCH)
+    queue.submit(lambda: None, BATCH)
+    with pytest.raises(AdmissionRejected):
+        queue.submit(lambda: None, BATCH)
+    queue.submit(lambda: None, INTERACTIVE)
@@ -0,0 +1,84 @@
+import sqlite3
+import pytest
+from database import init_db
+from plan_store import fetch_curriculum, insert_plan
+from progress_log import apply_changes
+
+PLAN = [(f"Topic {week}", 'Easy', 5, week, ['First', 'Second']) for week in (1, 2)]
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'smart_curriculum.db')
+    init_db(path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    for user_id in (1, 2):
+        conn.execute('INSERT INTO users (id, name, email, password) VALUES (?, ?, ?, ?)',
+                     (user_id, f"User {user_id}", f"user{user_id}@example.com", 'x'))
+        insert_plan(conn, user_id, PLAN)
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def item_ids(conn, user_id):
+    return [item['id'] for item in fetch_curriculum(conn, user_id)]
+
+
+def stored(conn):
+    """Every item's status and subtopic completion, plus the event count"""
+    items = [(item['id'], item['status'], [st['completed'] for st in item['subtopics']])
+             for user_id in (1, 2) for item in fetch_curriculum(conn, user_id)]
+    return items, conn.execute('SELECT COUNT(*) FROM progress_events').fetchone()[0]
+
+
+def test_items_of_another_user_are_not_found(conn):
+    mine, theirs = item_ids(conn, 1)[0], item_ids(conn, 2)[0]
+    before = stored(conn)
+    body, status = apply_changes(conn, 1, [{'curriculum_id': mine, 'status': 'completed'},
+                                           {'curriculum_id': theirs, 'status': 'completed'}])
+    assert status == 404
+    assert body['curriculum_ids'] == [theirs]
+    assert stored(conn) == before
+
+
+@pytest.mark.parametrize('bad_change', [{'subtopic_index': 2, 'completed': True},
+                                        {'subtopic_index': True, 'completed': True},
+                                        {'status': 'in-progress'},
+                                        {'completed': True}])
+def test_invalid_change_writes_nothing(conn, bad_change):
+    first, second = item_ids(conn, 1)
+    before = stored(conn)
+    _, status = apply_changes(conn, 1, [{'curriculum_id': first, 'status': 'completed'},
+                                        dict(bad_change, curriculum_id=second)])
+    assert status == 400
+    assert stored(conn) == before
+
+
+def test_finishing_every_subtopic_completes_the_parent(conn):
+    first, second = item_ids(conn, 1)
+    body, status = apply_changes(conn, 1, [{'curriculum_id': first, 'subtopic_index': 0, 'completed': True},
+                                           {'curriculum_id': first, 'subtopic_index': 1, 'completed': True},
+                                           {'curriculum_id': second, 'subtopic_index': 0, 'completed': True}])
+    assert status == 200
+    returned = {item['id']: item for item in body['items']}
+    assert returned[first]['status'] == 'completed'
+    assert [st['completed'] for st in returned[first]['subtopics']] == [True, True]
+    assert returned[second]['status'] == 'pending'
+    assert [st['completed'] for st in returned[second]['subtopics']] == [True, False]
+    assert {item['id']: item['status'] for item in fetch_curriculum(conn, 1)} == {first: 'completed', second: 'pending'}
+    # Two subtopic events and one topic event for the first item, one subtopic event for the second
+    assert conn.execute('SELECT COUNT(*) FROM progress_events').fetchone()[0] == 4
+
+
+def test_parent_is_checked_after_all_changes(conn):
+    first, _ = item_ids(conn, 1)
+    body, status = apply_changes(conn, 1, [{'curriculum_id': first, 'subtopic_index': 0, 'completed': True},
+                                           {'curriculum_id': first, 'subtopic_index': 1, 'completed': True},
+                                           {'curriculum_id': first, 'subtopic_index': 0, 'completed': False}])
+    assert status == 200
+    assert body['items'][0]['status'] == 'pending'
+    # Status-only changes are never overridden
+    body, _ = apply_changes(conn, 1, [{'curriculum_id': first, 'status': 'completed'}])
+    assert body['items'][0]['status'] == 'completed'
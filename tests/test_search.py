@@ -0,0 +1,118 @@
+import pytest
+import database
+import search
+from database import init_db, make_backend, shard_key
+from plan_store import insert_plan
+from search import Scorer, fts_totals, search_curriculum, to_match_expression, tokenize
+
+
+def plan(*topics, subtopics=('Basics', 'Practice')):
+    return [(topic, 'Easy', 5, week, list(subtopics)) for week, topic in enumerate(topics, start=1)]
+
+
+@pytest.fixture
+def use_backend(tmp_path, monkeypatch):
+    """Point database and search at a fresh set of files with the given shard count"""
+    def setup(shard_count, name='smart_curriculum.db'):
+        backend = make_backend(shard_count, str(tmp_path / name))
+        monkeypatch.setattr(database, 'backend', backend)
+        monkeypatch.setattr(search, 'backend', backend)
+        init_db()
+        return backend
+    return setup
+
+
+def add_user(backend, user_id, branch, topics_list, career_goal='Developer'):
+    directory = backend.connect()
+    directory.execute('INSERT INTO users (id, name, email, password, career_goal, branch) VALUES (?, ?, ?, ?, ?, ?)',
+                      (user_id, f"User {user_id}", f"user{user_id}@example.com", 'x', career_goal, branch))
+    directory.commit()
+    directory.close()
+    conn = backend.connect(shard_key(user_id=user_id))
+    insert_plan(conn, user_id, topics_list)
+    conn.commit()
+    conn.close()
+
+
+def test_fts_totals_and_scores_match_bm25(use_backend):
+    backend = use_backend(1)
+    add_user(backend, 1, 'CSE', plan('Python Basics', 'Web Python Services', 'Databases',
+                                     subtopics=('Joins', 'Indexes', 'Python drivers')))
+    add_user(backend, 2, 'CSE', plan('Statistics', 'Linear Algebra'))
+
+    conn = backend.connect()
+    rows = conn.execute('SELECT topic, subtopics FROM shared_plan_items_fts').fetchall()
+    assert fts_totals(conn, 'shared_plan_items_fts') == \
+        (len(rows), sum(len(tokenize(row['topic']) + tokenize(row['subtopics'])) for row in rows))
+
+    # Terms with no longer words sharing their prefix score exactly like FTS5's own bm25()
+    for text in ('python', 'web python', 'indexes'):
+        terms = tokenize(text)
+        scorer = Scorer(terms)
+        scorer.add_table(conn, 'shared_plan_items_fts')
+        matches = conn.execute('''SELECT topic, subtopics, -bm25(shared_plan_items_fts) AS expected
+                                  FROM shared_plan_items_fts WHERE shared_plan_items_fts MATCH ?''',
+                               (to_match_expression(terms),)).fetchall()
+        assert matches
+        for row in matches:
+            assert scorer.score(row) == pytest.approx(row['expected'])
+    conn.close()
+
+
+def test_user_search_only_returns_that_users_items(use_backend):
+    backend = use_backend(1)
+    add_user(backend, 1, 'CSE', plan('Python Basics', 'Databases'))
+    add_user(backend, 2, 'CSE', plan('Python Basics', 'Advanced Python'))
+
+    results = search_curriculum('python', user_id=2)
+    assert {result['user_id'] for result in results} == {2}
+    assert sorted(result['topic'] for result in results) == ['Advanced Python', 'Python Basics']
+    assert [result['score'] for result in results] == sorted((result['score'] for result in results), reverse=True)
+    assert '[Python]' in search_curriculum('python', user_id=1)[0]['snippet']
+
+
+def test_cohort_filter_reaches_matches_ranked_below_the_candidates(use_backend):
+    backend = use_backend(1)
+    # Many better matches owned by one branch...
+    add_user(backend, 1, 'CSE', plan(*[f"Python {i}" for i in range(300)]))
+    # ...and a single weak match in another branch
+    add_user(backend, 2, 'BIO', plan('Python for lab data pipelines and sequencing workflows'),
+             career_goal='Bioinformatician')
+
+    for filters in ({'branch': 'BIO'}, {'career_goal': 'Bioinformatician'}):
+        results = search_curriculum('python', **filters)
+        assert [result['user_id'] for result in results] == [2]
+    assert search_curriculum('python', branch='EEE') == []
+
+
+def test_cohort_pages_cover_every_match_once(use_backend):
+    backend = use_backend(1)
+    add_user(backend, 1, 'CSE', plan(*[f"Python {i}" for i in range(250)]))
+    add_user(backend, 2, 'CSE', plan(*[f"Python {i}" for i in range(30)]))
+
+    pages = [search_curriculum('python', branch='CSE', limit=100, offset=offset) for offset in range(0, 400, 100)]
+    assert [len(page) for page in pages] == [100, 100, 80, 0]
+    ids = [result['curriculum_id'] for page in pages for result in page]
+    assert len(set(ids)) == 280
+    scores = [result['score'] for page in pages for result in page]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_search_merges_shards(use_backend):
+    users = [(user_id, 'CSE' if user_id % 3 else 'ECE', plan('Python Basics', f"Python Project {user_id}"))
+             for user_id in range(1, 9)]
+
+    def run(shard_count, name):
+        backend = use_backend(shard_count, name)
+        for user in users:
+            add_user(backend, *user)
+        return search_curriculum('python', branch='CSE', limit=100)
+
+    single = run(1, 'single.db')
+    sharded = run(2, 'sharded.db')
+    assert sorted((r['user_id'], r['topic']) for r in sharded) == sorted((r['user_id'], r['topic']) for r in single)
+    assert {r['user_id'] % 2 for r in sharded} == {0, 1}
+    # The shared item stored in both shards scores the same wherever its rows live
+    assert len({r['score'] for r in sharded if r['topic'] == 'Python Basics'}) == 1
+    scores = [r['score'] for r in sharded]
+    assert scores == sorted(scores, reverse=True)
@@ -0,0 +1,134 @@
+import sqlite3
+import pytest
+import database
+import shard_tool
+from database import NO_SHARD, SHARD_ID_SPAN, make_backend, init_db, init_shard_file, parse_id, shard_key
+from plan_store import insert_plan
+from progress_log import record_event
+from snapshots import archive_current_plan
+
+PLAN = [(f"Topic {week}", 'Easy', 10, week, [f"Subtopic {week}.{i}" for i in range(3)]) for week in range(1, 4)]
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / 'smart_curriculum.db')
+    init_db(path)
+    return path
+
+
+def populate(db_path, user_ids):
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    for user_id in user_ids:
+        conn.execute('INSERT INTO users (id, name, email, password, branch) VALUES (?, ?, ?, ?, ?)',
+                     (user_id, f"User {user_id}", f"user{user_id}@example.com", 'x', 'CSE'))
+        insert_plan(conn, user_id, PLAN)
+        curriculum_id = conn.execute('SELECT MIN(id) FROM curriculum WHERE user_id = ?', (user_id,)).fetchone()[0]
+        record_event(conn, user_id, curriculum_id, 'Easy', 'pending', 'completed')
+        archive_current_plan(conn, user_id)
+        insert_plan(conn, user_id, PLAN)
+    conn.commit()
+    conn.close()
+
+
+def rows_by_file(paths, table):
+    counts = {}
+    for path in paths:
+        conn = sqlite3.connect(path)
+        for user_id, count in conn.execute(f'SELECT user_id, COUNT(*) FROM {table} GROUP BY user_id'):
+            counts[user_id] = (path, count)
+        conn.close()
+    return counts
+
+
+def test_shard_routing():
+    backend = make_backend(3, 'smart_curriculum.db')
+    assert [backend.shard_for_user(user_id) for user_id in (3, 4, 5)] == [0, 1, 2]
+    assert backend.shard_for_curriculum(2 * SHARD_ID_SPAN + 17) == 2
+    assert backend.shard_path(1) == 'smart_curriculum.shard1.db'
+    assert make_backend(1).shard_for_user(5) == 0
+
+
+def test_shard_key_follows_backend(monkeypatch):
+    monkeypatch.setattr(database, 'backend', make_backend(4, 'smart_curriculum.db'))
+    assert shard_key(user_id=6) == 2
+    assert shard_key(curriculum_id=3 * SHARD_ID_SPAN + 1) == 3
+    assert shard_key() is None
+
+    monkeypatch.setattr(database, 'backend', make_backend(1, 'smart_curriculum.db'))
+    assert shard_key(user_id=6) is None
+
+
+def test_curriculum_ids_outside_every_shard_open_nothing(tmp_path, monkeypatch):
+    backend = make_backend(3, str(tmp_path / 'smart_curriculum.db'))
+    monkeypatch.setattr(database, 'backend', backend)
+    assert backend.shard_for_curriculum(9 * SHARD_ID_SPAN) is None
+    assert shard_key(curriculum_id=9 * SHARD_ID_SPAN) == NO_SHARD
+    assert shard_key(curriculum_id=3 * SHARD_ID_SPAN) == NO_SHARD
+    with pytest.raises(ValueError):
+        backend.connect(NO_SHARD)
+    with pytest.raises(ValueError):
+        backend.connect(9)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_parse_id():
+    assert parse_id(7) == 7
+    assert parse_id('12') == 12
+    for value in (None, '', 'abc', '1.5', True, 2.0, [1]):
+        assert parse_id(value) is None
+
+
+def test_curriculum_ids_start_in_shard_range(tmp_path, db_path):
+    path = str(tmp_path / 'smart_curriculum.shard2.db')
+    init_shard_file(path, 2)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    conn.execute('ATTACH DATABASE ? AS directory', (db_path,))
+    insert_plan(conn, 5, PLAN)
+    ids = [row[0] for row in conn.execute('SELECT id FROM curriculum ORDER BY id')]
+    conn.close()
+    assert ids[0] == 2 * SHARD_ID_SPAN + 1
+    assert all(id_ // SHARD_ID_SPAN == 2 for id_ in ids)
+
+
+def test_rebalance_moves_every_user_to_its_shard(db_path):
+    user_ids = list(range(1, 11))
+    populate(db_path, user_ids)
+
+    shard_tool.rebalance(3, db_path)
+    target = make_backend(3, db_path)
+    shard_paths = target.shard_paths()
+    for table in ('curriculum', 'curriculum_snapshots', 'progress_events'):
+        placed = rows_by_file([db_path] + shard_paths, table)
+        assert sorted(placed) == user_ids
+        for user_id, (path, _) in placed.items():
+            assert path == target.shard_path(target.shard_for_user(user_id))
+    for shard, path in enumerate(shard_paths):
+        conn = sqlite3.connect(path)
+        ids = [row[0] for row in conn.execute('SELECT id FROM curriculum')]
+        branches = {row[0] for row in conn.execute('SELECT DISTINCT branch FROM curriculum')}
+        conn.close()
+        assert all(target.shard_for_curriculum(id_) == shard for id_ in ids)
+        assert branches == {'CSE'}
+
+    # Back to a single file: everything returns to the directory file intact
+    shard_tool.rebalance(1, db_path)
+    placed = rows_by_file([db_path] + shard_paths, 'curriculum')
+    assert {user_id: entry for user_id, entry in placed.items()} == \
+        {user_id: (db_path, len(PLAN)) for user_id in user_ids}
+    assert set(rows_by_file([db_path], 'curriculum_snapshots')) == set(user_ids)
+
+
+def test_rebalance_keeps_rollup_totals(db_path):
+    populate(db_path, range(1, 7))
+    shard_tool.rebalance(2, db_path)
+    shard_tool.rebalance(1, db_path)
+
+    conn = sqlite3.connect(db_path)
+    completed, active = conn.execute('''SELECT SUM(CASE WHEN branch != '*' AND difficulty_level != '*' THEN topics_completed ELSE 0 END),
+                                               SUM(CASE WHEN branch = '*' AND difficulty_level = '*' THEN active_users ELSE 0 END)
+                                        FROM progress_rollups WHERE bucket = 'day' AND user_id = 0''').fetchone()
+    conn.close()
+    assert (completed, active) == (6, 6)
@@ -0,0 +1,56 @@
+import sqlite3
+import pytest
+from database import init_db
+from skill_stats import apply_profile_change, backfill
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'smart_curriculum.db')
+    init_db(path)
+    conn = sqlite3.connect(path)
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+def counters(conn):
+    return {(row['kind'], row['name']): (row['display_name'], row['user_count'])
+            for row in conn.execute('SELECT * FROM profile_terms')}
+
+
+def test_profile_changes_adjust_counters(conn):
+    apply_profile_change(conn, None, {'career_goal': 'Data Scientist', 'skills': 'Python, SQL', 'weak_subjects': ''})
+    apply_profile_change(conn, None, {'career_goal': 'data  scientist', 'skills': 'python', 'weak_subjects': 'Math'})
+    assert counters(conn) == {
+        ('career_goal', 'data scientist'): ('Data Scientist', 2),
+        ('skill', 'python'): ('Python', 2),
+        ('skill', 'sql'): ('SQL', 1),
+        ('weak_subject', 'math'): ('Math', 1),
+    }
+
+    # A case / whitespace variant of a kept term changes nothing; SQL is
+    # added to the second user and Math removed
+    apply_profile_change(conn,
+                         {'career_goal': 'data  scientist', 'skills': 'python', 'weak_subjects': 'Math'},
+                         {'career_goal': 'Data Scientist', 'skills': ' PYTHON ,SQL', 'weak_subjects': ''})
+    assert counters(conn) == {
+        ('career_goal', 'data scientist'): ('Data Scientist', 2),
+        ('skill', 'python'): ('Python', 2),
+        ('skill', 'sql'): ('SQL', 2),
+    }
+
+
+def test_last_user_removing_a_term_deletes_it(conn):
+    apply_profile_change(conn, None, {'skills': 'Rust'})
+    apply_profile_change(conn, {'skills': 'Rust'}, {'skills': 'Go'})
+    assert counters(conn) == {('skill', 'go'): ('Go', 1)}
+
+
+def test_backfill_leaves_the_commit_to_the_caller(conn):
+    conn.execute("INSERT INTO users (name, email, password, skills) VALUES ('A', 'a@example.com', 'x', 'Python, SQL')")
+    conn.commit()
+    assert backfill(conn) == 2
+    assert conn.in_transaction
+    conn.rollback()
+    assert counters(conn) == {}
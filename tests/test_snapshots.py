@@ -0,0 +1,32 @@
+import sqlite3
+from database import init_db
+from snapshots import compress_items, decompress_items, release_free_pages
+
+
+def test_new_database_uses_incremental_auto_vacuum(tmp_path):
+    path = str(tmp_path / 'smart_curriculum.db')
+    init_db(path)
+    conn = sqlite3.connect(path)
+    assert conn.execute('PRAGMA auto_vacuum').fetchone()[0] == 2
+    conn.close()
+
+
+def test_release_free_pages_empties_the_freelist(tmp_path):
+    path = str(tmp_path / 'smart_curriculum.db')
+    init_db(path)
+    conn = sqlite3.connect(path)
+    conn.executemany('INSERT INTO curriculum_snapshots (user_id, version, created_at, item_count, payload) VALUES (?, ?, 0, 0, ?)',
+                     [(1, version, b'x' * 5000) for version in range(200)])
+    conn.commit()
+    conn.execute('DELETE FROM curriculum_snapshots')
+    assert release_free_pages(conn) > 0
+    # Still inside the caller's transaction
+    assert conn.in_transaction
+    conn.commit()
+    assert conn.execute('PRAGMA freelist_count').fetchone()[0] == 0
+    conn.close()
+
+
+def test_snapshot_payload_round_trip():
+    items = [{'topic': 'Python', 'subtopics': [{'title': 'Lists', 'completed': True}]}]
+    assert decompress_items(compress_items(items)) == items
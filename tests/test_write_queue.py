@@ -0,0 +1,78 @@
+import sqlite3
+import pytest
+import write_queue
+from database import SingleFileBackend
+from write_queue import GroupCommitWriter
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    path = str(tmp_path / 'writes.db')
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE t (value INTEGER)')
+    conn.commit()
+    conn.close()
+    monkeypatch.setattr(write_queue, 'backend', SingleFileBackend(path))
+    return path
+
+
+def values(path):
+    conn = sqlite3.connect(path)
+    rows = [row[0] for row in conn.execute('SELECT value FROM t ORDER BY value')]
+    conn.close()
+    return rows
+
+
+def insert(value):
+    def fn(conn):
+        conn.execute('INSERT INTO t (value) VALUES (?)', (value,))
+        return value
+    return fn
+
+
+def test_queued_operations_commit_together(db_path):
+    # A long delay with a batch size of 3 makes the three submissions one group
+    writer = GroupCommitWriter(None, max_delay=5, max_batch=3)
+
+    def visible_elsewhere(conn):
+        return values(db_path)
+
+    futures = [writer.submit(insert(1)), writer.submit(insert(2)), writer.submit(visible_elsewhere)]
+    assert [future.result(timeout=5) for future in futures] == [1, 2, []]
+    assert values(db_path) == [1, 2]
+
+
+def test_failed_operation_rolls_back_only_itself(db_path):
+    writer = GroupCommitWriter(None, max_delay=5, max_batch=3)
+
+    def insert_then_fail(conn):
+        conn.execute('INSERT INTO t (value) VALUES (2)')
+        raise ValueError('bad change')
+
+    futures = [writer.submit(insert(1)), writer.submit(insert_then_fail), writer.submit(insert(3))]
+    assert futures[0].result(timeout=5) == 1
+    with pytest.raises(ValueError, match='bad change'):
+        futures[1].result(timeout=5)
+    assert futures[2].result(timeout=5) == 3
+    assert values(db_path) == [1, 3]
+
+
+def test_writer_switches_the_file_to_wal(db_path):
+    writer = GroupCommitWriter(None, max_delay=0, max_batch=1)
+    writer.submit(insert(1)).result(timeout=5)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn.close()
+
+
+def test_direct_mode_rolls_back_on_error(db_path, monkeypatch):
+    monkeypatch.setattr(write_queue, 'DB_WRITE_MODE', 'direct')
+
+    def insert_then_fail(conn):
+        insert(1)(conn)
+        raise ValueError('bad change')
+
+    with pytest.raises(ValueError):
+        write_queue.run_write_to(None, insert_then_fail)
+    assert write_queue.run_write_to(None, insert(2)) == 2
+    assert values(db_path) == [2]
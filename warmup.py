@@ -0,0 +1,115 @@
+import argparse
+import os
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from ai_service import API_KEY, GEMINI_RATE_PER_SEC, AdmissionRejected, GenerativeAIService, TokenBucket
+from database import get_db_connection
+from plan_cache import cache_key, cached_keys
+
+# Pre-generates cached plans for the most common (career goal, weeks, hours)
+# combinations so new sign-ups skip the model call. Warm-up calls go through
+# the shared admission queue at batch priority and, on top of that, draw
+# from their own token bucket so they never take the whole model budget.
+
+# Combinations to warm when the app starts (0 disables the startup job)
+CACHE_WARMUP_COMBINATIONS = int(os.getenv("CACHE_WARMUP_COMBINATIONS", "0"))
+# Model calls per second the warm-up may spend, and how many it keeps in flight
+CACHE_WARMUP_RATE_PER_SEC = float(os.getenv("CACHE_WARMUP_RATE_PER_SEC", str(GEMINI_RATE_PER_SEC / 2)))
+CACHE_WARMUP_WORKERS = int(os.getenv("CACHE_WARMUP_WORKERS", "2"))
+
+MAX_ATTEMPTS = 5
+
+
+def popular_combinations(limit):
+    """Most frequent (career_goal, weeks, hours_per_day) among users, most common first"""
+    conn = get_db_connection()
+    rows = conn.execute('''SELECT career_goal, weeks_available, hours_per_day, COUNT(*) AS users FROM users
+                           WHERE career_goal IS NOT NULL AND TRIM(career_goal) != ''
+                           GROUP BY career_goal, weeks_available, hours_per_day''').fetchall()
+    conn.close()
+
+    # Fold spelling variants of a goal together; keep the most common spelling for the prompt
+    counts = Counter()
+    spellings = {}
+    for row in rows:
+        key = cache_key(row['career_goal'], row['weeks_available'] or 8, row['hours_per_day'] or 2.0)
+        counts[key] += row['users']
+        spelling = ' '.join(row['career_goal'].split())
+        if key not in spellings or row['users'] > spellings[key][1]:
+            spellings[key] = (spelling, row['users'])
+    return [(spellings[key][0],) + key[1:] + (users,) for key, users in counts.most_common(limit)]
+
+
+def _warm(combination, bucket):
+    career_goal, weeks, hours_per_day, _ = combination
+    for attempt in range(MAX_ATTEMPTS):
+        bucket.acquire()
+        try:
+            GenerativeAIService.refresh_cached_plan(career_goal, weeks, hours_per_day)
+            return True
+        except AdmissionRejected as e:
+            # Interactive traffic has the queue; back off and try again
+            time.sleep(e.retry_after)
+        except Exception as e:
+            print(f"Warm-up failed for {career_goal} ({weeks} weeks, {hours_per_day}h/day): {e}")
+            return False
+    return False
+
+
+def warm_cache(limit, rate=CACHE_WARMUP_RATE_PER_SEC, workers=CACHE_WARMUP_WORKERS, refresh=False):
+    """Generate and cache plans for the `limit` most popular combinations.
+
+    Combinations with a fresh cache entry are skipped unless refresh is set.
+    Returns (warmed, skipped, failed).
+    """
+    if not API_KEY:
+        print("GEMINI_API_KEY not set; the mock generator needs no warm-up.")
+        return 0, 0, 0
+
+    combinations = popular_combinations(limit)
+    if not refresh:
+        fresh = cached_keys()
+        pending = [c for c in combinations if cache_key(*c[:3]) not in fresh]
+    else:
+        pending = combinations
+    skipped = len(combinations) - len(pending)
+
+    bucket = TokenBucket(rate, 1)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='cache-warmup') as pool:
+        results = list(pool.map(lambda combination: _warm(combination, bucket), pending))
+    warmed = sum(results)
+    return warmed, skipped, len(results) - warmed
+
+
+def start_warmup(limit):
+    """Run warm_cache() once on a daemon thread"""
+    def run():
+        try:
+            warmed, skipped, failed = warm_cache(limit)
+            print(f"Cache warm-up: {warmed} generated, {skipped} already fresh, {failed} failed")
+        except Exception as e:
+            print(f"Cache warm-up error: {e}")
+
+    worker = threading.Thread(target=run, name='cache-warmup', daemon=True)
+    worker.start()
+    return worker
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Pre-generate cached curricula for popular career goals")
+    parser.add_argument('--top', type=int, default=CACHE_WARMUP_COMBINATIONS or 50,
+                        help="Number of most common (career goal, weeks, hours) combinations to warm")
+    parser.add_argument('--rate', type=float, default=CACHE_WARMUP_RATE_PER_SEC, help="Model calls per second to spend")
+    parser.add_argument('--workers', type=int, default=CACHE_WARMUP_WORKERS, help="Generations kept in flight")
+    parser.add_argument('--refresh', action='store_true', help="Regenerate entries that are still fresh")
+    parser.add_argument('--list', action='store_true', help="Only print the combinations that would be warmed")
+    args = parser.parse_args()
+
+    if args.list:
+        for career_goal, weeks, hours_per_day, users in popular_combinations(args.top):
+            print(f"{users:>8}  {career_goal} / {weeks} weeks / {hours_per_day}h per day")
+    else:
+        warmed, skipped, failed = warm_cache(args.top, args.rate, args.workers, args.refresh)
+        print(f"Generated {warmed} plans, {skipped} already fresh, {failed} failed.")
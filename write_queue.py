@@ -0,0 +1,128 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from database import backend, shard_key
+
+# With DB_WRITE_MODE=queue every mutation is handed to one writer thread
+# per database file instead of committing on the request thread. The
+# writer runs queued operations back to back inside one transaction (each
+# in its own savepoint, so one failure does not sink the others) and
+# commits the whole group at once. Callers block on a future for their
+# result. With the default "direct" mode the operation runs in its own
+# BEGIN IMMEDIATE transaction on a fresh connection, so its reads and
+# writes are atomic in both modes.
+#
+# Queue mode switches every file it writes to WAL journaling, so request
+# threads keep reading while a group is open. The setting is persistent:
+# the file stays in WAL mode after going back to direct writes.
+
+DB_WRITE_MODE = os.getenv("DB_WRITE_MODE", "direct")
+WRITE_BATCH_MAX_DELAY_MS = float(os.getenv("WRITE_BATCH_MAX_DELAY_MS", "5"))
+WRITE_BATCH_MAX_SIZE = int(os.getenv("WRITE_BATCH_MAX_SIZE", "64"))
+
+
+class GroupCommitWriter:
+    """Single writer thread that group-commits queued operations on one database file"""
+
+    def __init__(self, key, max_delay, max_batch):
+        self.key = key
+        self.max_delay = max_delay
+        self.max_batch = max_batch
+        self.operations = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=f"db-writer-{key}", daemon=True)
+        self.thread.start()
+
+    def submit(self, fn):
+        future = Future()
+        self.operations.put((fn, future))
+        return future
+
+    def _next_batch(self):
+        batch = [self.operations.get()]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.operations.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        conn = backend.connect(self.key)
+        # Transactions are managed explicitly below
+        conn.isolation_level = None
+        # Persistent; see the note at the top of this module
+        conn.execute('PRAGMA journal_mode = WAL')
+        while True:
+            batch = self._next_batch()
+            results = []
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                for fn, future in batch:
+                    conn.execute('SAVEPOINT operation')
+                    try:
+                        results.append((future, fn(conn), None))
+                        conn.execute('RELEASE operation')
+                    except Exception as e:
+                        conn.execute('ROLLBACK TO operation')
+                        conn.execute('RELEASE operation')
+                        results.append((future, None, e))
+                conn.execute('COMMIT')
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                for fn, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for future, result, error in results:
+                if error is not None:
+                    future.set_exception(error)
+                else:
+                    future.set_result(result)
+
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def _writer_for(key):
+    with _writers_lock:
+        writer = _writers.get(key)
+        if writer is None:
+            writer = GroupCommitWriter(key, WRITE_BATCH_MAX_DELAY_MS / 1000, WRITE_BATCH_MAX_SIZE)
+            _writers[key] = writer
+        return writer
+
+
+def run_write(fn, user_id=None, curriculum_id=None):
+    """Run fn(conn) as a committed write on the file owning user_id / curriculum_id.
+
+    fn must not commit; whatever it returns (or raises) is passed back to
+    the caller.
+    """
+    return run_write_to(shard_key(user_id=user_id, curriculum_id=curriculum_id), fn)
+
+
+def run_write_to(key, fn):
+    """run_write for a file given by its shard key, for jobs that walk every shard"""
+    if DB_WRITE_MODE == 'queue':
+        return _writer_for(key).submit(fn).result()
+
+    conn = backend.connect(key)
+    try:
+        # Take the write lock before fn reads anything
+        conn.execute('BEGIN IMMEDIATE')
+        result = fn(conn)
+        conn.commit()
+        return result
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()